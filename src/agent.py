@@ -11,7 +11,7 @@ from langgraph.prebuilt import ToolNode
 import json
 import copy
 import database as db
-from tools import transfer_funds, get_balance, list_available_accounts, get_transaction_rules
+from tools import transfer_funds, get_balance, list_available_accounts, get_transaction_rules, get_max_transfer_amount
 from verifier import guardian_check
 
 load_dotenv()
@@ -80,7 +80,7 @@ def guardian_node(state: AgentState):
             "execution_history": state.get("execution_history", []) + [history_entry]
         }
 
-    if tool_name == 'transfer_funds':
+    if tool_name in ('transfer_funds', 'get_max_transfer_amount'):
         original_args = tool_call['args']
         normalized_args = original_args.copy()
 
@@ -105,9 +105,12 @@ def guardian_node(state: AgentState):
             # Update the tool call with the corrected arguments before verification
             tool_call['args'] = normalized_args
 
-    is_safe, reason = guardian_check(tool_call)
+    is_safe, reason, proof = guardian_check(tool_call, with_proof=True)
     history_entry = {
         "tool_name": tool_call['name'], "tool_args": tool_call['args']}
+    if proof is not None:
+        # Only the compact handle is kept; the UI renders the full proof when the entry is expanded.
+        history_entry["proof"] = proof
 
     if is_safe:
         if tool_name == 'transfer_funds':
@@ -196,7 +199,7 @@ def talker_node(state: AgentState):
             f"'{last_human_message}'"
         )
     else:
-        last_event = history[-1]
+        last_event = {key: value for key, value in history[-1].items() if key != "proof"}
         status = last_event.get("status")
         if status == "AWAITING_CONFIRMATION":
             # This is a special case handled by the UI, but we provide a fallback message.
@@ -257,7 +260,7 @@ def no_op():
 
 
 tools = [transfer_funds, get_balance,
-         list_available_accounts, get_transaction_rules]
+         list_available_accounts, get_transaction_rules, get_max_transfer_amount]
 tool_node_executor = ToolNode(tools)
 
 # --- Graph Definition ---
@@ -1,8 +1,9 @@
 # app.py
-from verifier import get_account_id_map
 from agent import app
 import database as db
 from config import SECURITY_RULES
+import metrics
+from verifier import render_proof
 import streamlit as st
 from langchain_core.messages import HumanMessage, AIMessage
 import time
@@ -10,6 +11,8 @@ from collections import deque
 
 
 st.set_page_config(layout="wide")
+# Opt-in latency metrics exporter (no-op unless metrics_enabled is configured); started once per process.
+metrics.start_exporters()
 
 st.title("🛡️ SentinelVerifier Demo")
 st.caption(
@@ -133,7 +136,7 @@ with col2:
     st.header("System Monitor")
 
     st.subheader("Live Account Balances")
-    st.json({acc['id']: f"${acc['balance']:,}" for acc in db.get_all_accounts()})
+    st.json({acc['id']: db.format_cents(acc['balance']) for acc in db.get_all_accounts()})
 
     st.subheader("System Rules")
     st.markdown(
@@ -166,51 +169,35 @@ with col2:
                         st.markdown("---")
                         st.markdown("##### Proof Visualization")
 
-                        args = event.get("tool_args", {})
-                        amount = args.get("amount", "N/A")
-                        dest = args.get("destination", "N/A")
                         reason = event.get("reason", "")
-
-                        ACCOUNT_ID_MAP = get_account_id_map()
-                        # Check if account exists before showing Z3 proof
-                        if dest in ACCOUNT_ID_MAP:
-                            dest_id = ACCOUNT_ID_MAP[dest]
-                            user_acct_id = ACCOUNT_ID_MAP.get(
-                                'USER_ACCOUNT', 0)
-                            high_value_threshold = SECURITY_RULES.get(
-                                "high_value_threshold", 8000)
-                            high_value_dest_acct_name = SECURITY_RULES.get(
-                                "high_value_destination_account", "Account_D")
-
-                            st.code(f"""
-# Z3 Solver Input
-# Security Invariant: Sender must be USER_ACCOUNT
-solver.add(sender == {user_acct_id})
-# Amount constraints
-solver.add(amount > 0)
-solver.add(amount <= {SECURITY_RULES.get('max_amount')})
-# Policy: High-value transfers must go to {high_value_dest_acct_name}
-solver.add(Implies(amount > {high_value_threshold}, destination == {ACCOUNT_ID_MAP.get(high_value_dest_acct_name, 'N/A')}))
-# Proposed action
-solver.add(amount == {amount})
-solver.add(destination == {dest_id})
-solver.add(sender == {user_acct_id})
-                            """, language="python")
-
-                            st.markdown("##### Z3 Solver Output")
-                            if status == "BLOCKED" and any(keyword in reason for keyword in ["Authorization Violation", "Policy Violation", "Limit Exceeded", "Invalid Amount", "Verification Failed"]):
-                                st.error(
-                                    f"UNSATISFIABLE\n\n**Reason:** {reason}")
-                            elif status in ["APPROVED", "SUCCESSFULLY_EXECUTED"]:
-                                st.success(
-                                    "SATISFIABLE\n\nAll invariants satisfied. Transaction approved.")
-                            else:
-                                st.warning(
-                                    f"NOT CHECKED BY Z3\n\n**Reason:** {reason}")
+                        proof = event.get("proof")
+
+                        if proof is not None:
+                            # The entry only stores a proof handle; the certificate is regenerated on request.
+                            if st.checkbox("Show Z3 proof", key=f"proof_{len(history) - i}"):
+                                certificate = render_proof(proof)
+                                st.code(certificate["smtlib"], language="lisp")
+
+                                st.markdown("##### Z3 Solver Output")
+                                result = certificate["result"]
+                                if result == "unsat":
+                                    st.error(
+                                        f"UNSATISFIABLE\n\n**Unsat core:** {', '.join(certificate['core'])}\n\n**Reason:** {reason}")
+                                elif result == "unknown":
+                                    st.error(
+                                        f"UNKNOWN (budget exhausted, blocked fail-closed)\n\n**Reason:** {reason}")
+                                elif result == "sat" and status == "BLOCKED":
+                                    st.warning(
+                                        f"SATISFIABLE, but blocked by a later check\n\n**Reason:** {reason}")
+                                elif result == "sat":
+                                    st.success(
+                                        "SATISFIABLE\n\nAll invariants satisfied. Transaction approved.")
+                                else:
+                                    st.info(certificate["smtlib"])
                         else:
-                            # Account doesn't exist - show a clear message instead of a broken proof
+                            # Blocked before the proof (e.g. unknown or blacklisted destination) - nothing to show
                             st.info(
-                                "**Pre-Verification Check Failed**\n\nThe destination account does not exist, so the Z3 proof was not executed.")
+                                "**Pre-Verification Check Failed**\n\nThe destination check blocked the transfer, so the Z3 proof was not executed.")
                             st.error(f"**Blocked:** {reason}")
                 else:
                     st.markdown(summary)
@@ -0,0 +1,460 @@
+# benchmark.py
+"""
+Micro-benchmarks for the guardian's verification path.
+Run from the src/ directory, e.g. `python benchmark.py policy`.
+Benchmarks use a synthetic account set or a scratch database, never the live one.
+"""
+import argparse
+import atexit
+import os
+import random
+import tempfile
+import time
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
+
+from z3 import Context
+
+from config import SECURITY_RULES, STORAGE_PROFILES, STORAGE_SETTINGS, VERIFIER_SETTINGS, save_solver_tuning
+import database as db
+import fuzz
+import metrics
+import verifier
+
+SYNTHETIC_ACCOUNTS = ["USER_ACCOUNT", "Account_A", "Account_B", "Account_C", "Account_D"]
+
+def synthetic_account_id_map(extra_accounts: int = 0) -> dict[str, int]:
+    """Builds an account-ID map like get_account_id_map() without a database."""
+    names = SYNTHETIC_ACCOUNTS + [f"Account_{i}" for i in range(extra_accounts)]
+    return {name: i for i, name in enumerate(names)}
+
+def synthetic_transactions(n: int, seed: int = 0) -> list[tuple[int, str]]:
+    """Generates (amount, destination) pairs spread around the policy boundaries."""
+    rng = random.Random(seed)
+    limit = SECURITY_RULES.get("max_amount", 10000)
+    return [(rng.randint(-100, limit + 2000), rng.choice(SYNTHETIC_ACCOUNTS[1:])) for _ in range(n)]
+
+def use_scratch_database() -> str:
+    """Points the database module at a freshly initialized temporary database file."""
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    atexit.register(os.remove, path)
+    db.close_db_connection()
+    db.DATABASE_FILE = path
+    db.initialize_database()
+    return path
+
+def _report(label: str, elapsed: float, n: int):
+    print(f"{label:<40} {elapsed / n * 1e6:>10.1f} us/check {n / elapsed:>12,.0f} checks/s")
+
+def bench_policy(n: int):
+    """Compares rebuilding the solver per check with the compiled, incremental policy."""
+    id_map = synthetic_account_id_map()
+    txs = synthetic_transactions(n)
+    user_id = id_map["USER_ACCOUNT"]
+
+    start = time.perf_counter()
+    for amount, dest in txs:
+        verifier.CompiledPolicy(verifier._current_program(), id_map).check(amount, id_map[dest], user_id)
+    _report("fresh solver per check (before)", time.perf_counter() - start, n)
+
+    policy = verifier.CompiledPolicy(verifier._current_program(), id_map)
+    start = time.perf_counter()
+    for amount, dest in txs:
+        policy.check(amount, id_map[dest], user_id)
+    _report("compiled policy, push/pop check", time.perf_counter() - start, n)
+
+def bench_batch(n: int):
+    """Compares per-call guardian_check with verify_transactions_batch on the same transfers."""
+    use_scratch_database()
+    tool_calls = [
+        {"name": "transfer_funds", "args": {"amount": amount, "destination": dest}}
+        for amount, dest in synthetic_transactions(n)
+    ]
+
+    start = time.perf_counter()
+    per_call = [verifier.guardian_check(call) for call in tool_calls]
+    _report("guardian_check per call", time.perf_counter() - start, n)
+
+    start = time.perf_counter()
+    batched = verifier.verify_transactions_batch(tool_calls)
+    _report("verify_transactions_batch", time.perf_counter() - start, n)
+    assert batched == per_call, "batch verdicts diverged from guardian_check"
+
+def boundary_transactions(program, id_map: dict[str, int], n: int, seed: int = 0) -> list[tuple]:
+    """
+    Generates (amount, destination ID, sender ID, state) rows shaped by the policy: amounts and
+    account-state values cluster around the rule constants, and some senders are unauthorized.
+    Money state is drawn in cents, as stored, and converted the way the verifier converts it.
+    """
+    rng = random.Random(seed)
+    boundaries = fuzz.boundary_values(program)
+    money = fuzz.money_boundaries(program)
+    span = 2 * max(abs(c) for c in boundaries + [1])
+    accounts = list(id_map.values())
+
+    def value():
+        return rng.choice(boundaries) if rng.random() < 0.3 else rng.randint(-span, span)
+
+    def cents():
+        if rng.random() < 0.3:
+            return rng.choice(money)
+        return value() * db.CENTS_PER_DOLLAR + rng.randint(-db.CENTS_PER_DOLLAR + 1, db.CENTS_PER_DOLLAR - 1)
+
+    return [
+        (value(), rng.choice(accounts),
+         id_map["USER_ACCOUNT"] if rng.random() < 0.9 else rng.choice(accounts),
+         fuzz.policy_state(program, {name: abs(value()) if name == "window_transfers" else cents()
+                                     for name in program.state_variables}))
+        for _ in range(n)
+    ]
+
+def bench_prescreen(n: int):
+    """Times the vectorized pre-screen against Z3 (tests/test_verifier.py checks that they agree)."""
+    id_map = synthetic_account_id_map()
+    txs = synthetic_transactions(n)
+    policy = verifier.CompiledPolicy(verifier._current_program(), id_map)
+    amounts = [amount for amount, _ in txs]
+    destinations = [id_map[dest] for _, dest in txs]
+    senders = [id_map["USER_ACCOUNT"]] * n
+
+    start = time.perf_counter()
+    for amount, dest in zip(amounts, destinations):
+        policy.check(amount, dest, senders[0])
+    _report("Z3 check per row", time.perf_counter() - start, n)
+
+    start = time.perf_counter()
+    policy.prescreen(amounts, destinations, senders)
+    _report("vectorized pre-screen", time.perf_counter() - start, n)
+
+def bench_cache(n: int):
+    """Times verify_transaction_safety on resubmitted transactions with a cold and a warm verdict cache."""
+    use_scratch_database()
+    txs = synthetic_transactions(max(n // 10, 1)) * 10  # every transaction is submitted ten times
+
+    verifier._verdict_cache = verifier.VerdictCache(maxsize=0)
+    start = time.perf_counter()
+    for amount, dest in txs:
+        verifier.verify_transaction_safety(amount, dest)
+    _report("no verdict cache", time.perf_counter() - start, len(txs))
+
+    verifier._verdict_cache = verifier.VerdictCache()
+    start = time.perf_counter()
+    for amount, dest in txs:
+        verifier.verify_transaction_safety(amount, dest)
+    _report("LRU verdict cache", time.perf_counter() - start, len(txs))
+    print(verifier.get_verdict_cache_stats())
+
+def bench_intervals(n: int):
+    """Times interval-table lookups against Z3 and verifies both give the same verdict and reason."""
+    rng = random.Random(0)
+    id_map = synthetic_account_id_map(extra_accounts=5)
+    program = verifier._current_program()
+    policy = verifier.CompiledPolicy(program, {name: id_map[name] for name in program.referenced_accounts})
+    start = time.perf_counter()
+    policy.admissible_intervals()
+    print(f"interval table built in {(time.perf_counter() - start) * 1e3:.1f} ms")
+
+    accounts = list(id_map.values())
+    limit = SECURITY_RULES.get("max_amount", 10000)
+    txs = [
+        (rng.randint(-2 * limit, 2 * limit), rng.choice(accounts),
+         id_map["USER_ACCOUNT"] if rng.random() < 0.9 else rng.choice(accounts))
+        for _ in range(n)
+    ]
+
+    start = time.perf_counter()
+    expected = [policy.check(*tx) for tx in txs]
+    _report("Z3 check", time.perf_counter() - start, n)
+
+    start = time.perf_counter()
+    decided = [policy.decide(*tx) for tx in txs]
+    _report("interval table lookup", time.perf_counter() - start, n)
+    for tx, want, got in zip(txs, expected, decided):
+        assert want == got, f"interval table says {got} but Z3 says {want} for (amount, destination, sender)={tx}"
+
+def bench_tactics(n: int):
+    """
+    Times every solver configuration on the running policy's rule shapes and records the
+    fastest one whose verdicts and unsat cores match the generic solver's.
+    """
+    program = verifier._current_program()
+    id_map = synthetic_account_id_map(extra_accounts=5)
+    rows = boundary_transactions(program, id_map, n)
+    reference = verifier.CompiledPolicy(program, id_map, Context(), solver_config="generic")
+    expected = [reference.check(*row) for row in rows]
+
+    timings = {}
+    for name in verifier.SOLVER_CONFIGS:
+        policy = verifier.CompiledPolicy(program, id_map, Context(), solver_config=name)
+        for row in rows[:50]:
+            policy.check(*row)  # warm up outside the timed region
+        start = time.perf_counter()
+        got = [policy.check(*row) for row in rows]
+        elapsed = time.perf_counter() - start
+        if got != expected:
+            print(f"{name:<40} skipped: verdicts or unsat cores differ from the generic solver")
+            continue
+        timings[name] = elapsed
+        _report(f"{name} ({program.logic})", elapsed, n)
+
+    fastest = min(timings, key=timings.get)
+    save_solver_tuning(program.fingerprint, fastest)
+    print(f"fastest: {fastest}, recorded for policy {program.fingerprint[:12]} in {VERIFIER_SETTINGS['solver_tuning_file']}")
+
+def bench_threads(n: int):
+    """Measures Z3 check throughput through the context pool as the number of guardian threads grows."""
+    use_scratch_database()
+    txs = synthetic_transactions(n)
+    dest_ids = {name: db.get_account_num(name) for name in SYNTHETIC_ACCOUNTS}
+    user_id = dest_ids["USER_ACCOUNT"]
+
+    for threads in (1, 2, 4, 8):
+        pool = verifier.PolicyPool(threads)
+        shards = [txs[i::threads] for i in range(threads)]
+
+        def run(shard):
+            with pool.lease() as policy:
+                for amount, dest in shard:
+                    policy.check(amount, dest_ids[dest], user_id)
+
+        # Pre-build one policy per context outside the timed region.
+        with ExitStack() as stack:
+            for _ in range(threads):
+                stack.enter_context(pool.lease())
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            start = time.perf_counter()
+            list(executor.map(run, shards))
+            _report(f"{threads} thread(s), {pool.created} context(s)", time.perf_counter() - start, n)
+
+def bench_processes(n: int):
+    """Compares the in-process guardian path with the multiprocessing backend on the same transfers."""
+    import workers
+    use_scratch_database()
+    tool_calls = [
+        {"name": "transfer_funds", "args": {"amount": amount, "destination": dest}}
+        for amount, dest in synthetic_transactions(n)
+    ]
+    verifier._verdict_cache = verifier.VerdictCache(maxsize=0)  # measure verification, not memoization
+    # Warm the in-process path outside the timed region, as the workers warm up before theirs.
+    with verifier._policy_pool.lease() as policy:
+        policy.admissible_intervals()
+    verifier.guardian_check(tool_calls[0])
+
+    start = time.perf_counter()
+    expected = [verifier.guardian_check(call) for call in tool_calls]
+    _report("in-process guardian_check", time.perf_counter() - start, n)
+
+    start = time.perf_counter()
+    batched = verifier.verify_transactions_batch(tool_calls)
+    _report("in-process verify_transactions_batch", time.perf_counter() - start, n)
+
+    for count in (1, 2, 4):
+        with workers.ProcessVerifier(workers=count) as backend:
+            backend.guardian_check(tool_calls[0])  # wait for the workers to finish warming up
+            start = time.perf_counter()
+            got = backend.guardian_check_many(tool_calls)
+            _report(f"{count} worker process(es), guardian_check", time.perf_counter() - start, n)
+            assert got == expected, "process backend diverged from in-process guardian_check"
+
+            start = time.perf_counter()
+            got = backend.verify_transactions_batch(tool_calls)
+            _report(f"{count} worker process(es), batch", time.perf_counter() - start, n)
+            assert got == batched, "process backend diverged from in-process batch verification"
+
+def bench_metrics(n: int):
+    """Measures guardian_check with metrics disabled and enabled, then prints the per-stage latency summary."""
+    use_scratch_database()
+    tool_calls = [
+        {"name": "transfer_funds", "args": {"amount": amount, "destination": dest}}
+        for amount, dest in synthetic_transactions(n)
+    ]
+    verifier._verdict_cache = verifier.VerdictCache(maxsize=0)  # time the full verification path
+    verifier.guardian_check(tool_calls[0])  # build the leased policy outside the timed region
+
+    for enabled in (False, True):
+        metrics.enable(enabled)
+        start = time.perf_counter()
+        for call in tool_calls:
+            verifier.guardian_check(call)
+        _report(f"guardian_check, metrics {'enabled' if enabled else 'disabled'}", time.perf_counter() - start, n)
+    metrics.enable(VERIFIER_SETTINGS["metrics_enabled"])
+
+    for family in (verifier._stage_seconds, verifier._verify_seconds):
+        for (label,), series in sorted(family._children.items()):
+            count = sum(series.counts)
+            if count:
+                print(f"  {family.name}{{{family.label_names[0]}=\"{label}\"}}: {series.sum / count * 1e6:.1f} us mean over {count}")
+
+def _transfer_read_modify_write(sender: str, destination: str, amount: float) -> tuple[bool, str]:
+    """The call sequence transfer_funds used before db.transfer(): separate reads, then one commit per write."""
+    if not db.account_exists(sender) or not db.account_exists(destination):
+        return False, "Sender or destination account not found."
+    sender_balance = db.get_account_balance(sender)
+    destination_balance = db.get_account_balance(destination)
+    db.update_account_balance(sender, sender_balance - amount)
+    db.update_account_balance(destination, destination_balance + amount)
+    return True, "Transferred."
+
+def _run_transfers(transfer, threads: int, n: int) -> tuple[float, int]:
+    """Runs n one-cent transfers out of USER_ACCOUNT on `threads` writer threads; returns (elapsed, successes)."""
+    rng = random.Random(threads)
+    destinations = [rng.choice(SYNTHETIC_ACCOUNTS[1:]) for _ in range(n)]
+
+    def run(shard):
+        return sum(transfer("USER_ACCOUNT", destination, 1)[0] for destination in shard)
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        start = time.perf_counter()
+        successes = sum(executor.map(run, [destinations[i::threads] for i in range(threads)]))
+        return time.perf_counter() - start, successes
+
+def bench_transfers(n: int):
+    """
+    Runs transfers from concurrent writer threads through the old read-modify-write sequence and
+    through db.transfer(), counting lost updates (money created or destroyed) in each.
+    """
+    use_scratch_database()
+    for threads in (1, 4, 8):
+        for label, transfer in (("read-modify-write (before)", _transfer_read_modify_write), ("db.transfer", db.transfer)):
+            db.update_account_balance("USER_ACCOUNT", n)
+            total_before = sum(account["balance"] for account in db.get_all_accounts())
+            elapsed, successes = _run_transfers(transfer, threads, n)
+            balances = {account["id"]: account["balance"] for account in db.get_all_accounts()}
+            lost = abs(sum(balances.values()) - total_before) + abs(n - successes - balances["USER_ACCOUNT"])
+            print(f"{threads} writer(s), {label:<27} {successes / elapsed:>10,.0f} transfers/s, {lost:,.0f} lost update(s)")
+
+    # The guarded debit never overdraws: with funds for half the transfers, exactly half succeed.
+    db.update_account_balance("USER_ACCOUNT", n // 2)
+    _, successes = _run_transfers(db.transfer, 8, n)
+    print(f"guarded debit with funds for {n // 2:,}: {successes:,} succeeded, final balance {db.get_account_balance('USER_ACCOUNT')}")
+
+def bench_storage(n: int):
+    """
+    Runs a mixed load, guardian snapshot reads alongside transfers, on a small connection pool
+    under the legacy (rollback journal) and default (WAL) storage profiles.
+    """
+    path = use_scratch_database()
+    readers, writers = 6, 2
+    for profile in ("legacy", "default"):
+        db.close_db_connection()
+        db._pool = db.ConnectionPool(path, {"profile": profile, **STORAGE_PROFILES[profile], "pool_size": 4})
+        db.update_account_balance("USER_ACCOUNT", n)
+
+        def read(_):
+            for _ in range(n // readers):
+                db.get_transfer_snapshot("Account_A", "USER_ACCOUNT", 0)
+            return time.perf_counter()
+
+        def write(_):
+            for _ in range(n // (4 * writers)):
+                db.transfer("USER_ACCOUNT", "Account_B", 1)
+            return time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=readers + writers) as executor:
+            start = time.perf_counter()
+            read_done = executor.map(read, range(readers))
+            write_done = executor.map(write, range(writers))
+            read_elapsed, write_elapsed = max(read_done) - start, max(write_done) - start
+        reads, writes = n // readers * readers, n // (4 * writers) * writers
+        stats = db.get_pool_stats()
+        print(f"{profile:<8} {reads / read_elapsed:>10,.0f} reads/s {writes / write_elapsed:>8,.0f} writes/s"
+              f"   pool: {stats['created']} created, {stats['waits']:,} waits ({stats['wait_seconds']:.2f} s)")
+    db.close_db_connection()
+
+def bench_ledger(n: int):
+    """
+    Fills the transfers ledger with n transfers, without periodic balance snapshots and with them,
+    then times history lookups, point-in-time balance replays and a full audit against each.
+    """
+    default_interval = STORAGE_SETTINGS["ledger_snapshot_interval"]
+    rng = random.Random(0)
+    try:
+        for interval in (0, default_interval):
+            STORAGE_SETTINGS["ledger_snapshot_interval"] = interval
+            use_scratch_database()
+            db.update_account_balance("USER_ACCOUNT", 100 * n)
+            start = time.perf_counter()
+            first = time.time()
+            for i in range(n):
+                db.transfer("USER_ACCOUNT", SYNTHETIC_ACCOUNTS[1 + i % 4], 100)
+            elapsed = time.perf_counter() - start
+            last = time.time()
+            label = f"snapshot every {interval:,}" if interval else "no snapshots"
+            print(f"{label:<22} {n / elapsed:>10,.0f} transfers/s")
+
+            lookups = 200
+            start = time.perf_counter()
+            for _ in range(lookups):
+                db.get_transfer_history(rng.choice(SYNTHETIC_ACCOUNTS), limit=20)
+            print(f"  {'history (last 20)':<20} {(time.perf_counter() - start) / lookups * 1e6:>10.1f} us/query")
+            start = time.perf_counter()
+            for _ in range(lookups):
+                db.get_balance_at(rng.choice(SYNTHETIC_ACCOUNTS), rng.uniform(first, last))
+            print(f"  {'balance at time T':<20} {(time.perf_counter() - start) / lookups * 1e6:>10.1f} us/query")
+            start = time.perf_counter()
+            mismatches = db.audit_balances()
+            print(f"  {'audit':<20} {(time.perf_counter() - start) * 1e3:>10.1f} ms, {len(mismatches)} mismatch(es)")
+    finally:
+        STORAGE_SETTINGS["ledger_snapshot_interval"] = default_interval
+    db.close_db_connection()
+
+def bench_group_commit(n: int):
+    """
+    Compares per-call commits in db.transfer() with the group-commit writer, for growing numbers
+    of concurrent callers, under the default (synchronous=NORMAL) and durable (FULL) profiles.
+    """
+    path = use_scratch_database()
+    saved = dict(STORAGE_SETTINGS)
+    try:
+        for profile in ("default", "durable"):
+            for threads in (1, 8, 32):
+                rates = {}
+                for group_commit in (False, True):
+                    db.close_db_connection()
+                    STORAGE_SETTINGS.update(STORAGE_PROFILES[profile], group_commit=group_commit)
+                    db._pool = db.ConnectionPool(path, STORAGE_SETTINGS)
+                    db.update_account_balance("USER_ACCOUNT", n)
+                    elapsed, successes = _run_transfers(db.transfer, threads, n)
+                    rates[group_commit] = successes / elapsed
+                    lost = n - successes - db.get_account_balance("USER_ACCOUNT")
+                    batching = ""
+                    if group_commit:
+                        stats = db.get_group_commit_writer().stats()
+                        batching = f", {stats['operations'] / max(stats['batches'], 1):.1f} transfers/commit"
+                    label = "group commit" if group_commit else "per-call commit"
+                    print(f"{profile:<8} {threads:>2} caller(s), {label:<16} {rates[group_commit]:>10,.0f} transfers/s"
+                          f"{batching}, {lost:,} lost update(s)")
+                print(f"{'':<8} {'':>2} speedup {rates[True] / rates[False]:.2f}x")
+    finally:
+        db.close_db_connection()
+        STORAGE_SETTINGS.clear()
+        STORAGE_SETTINGS.update(saved)
+
+BENCHMARKS = {
+    "policy": bench_policy,
+    "batch": bench_batch,
+    "prescreen": bench_prescreen,
+    "cache": bench_cache,
+    "intervals": bench_intervals,
+    "tactics": bench_tactics,
+    "threads": bench_threads,
+    "processes": bench_processes,
+    "metrics": bench_metrics,
+    "transfers": bench_transfers,
+    "storage": bench_storage,
+    "ledger": bench_ledger,
+    "group_commit": bench_group_commit,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS) + ["all"])
+    parser.add_argument("-n", type=int, default=2000, help="Number of checks per run.")
+    args = parser.parse_args()
+
+    selected = BENCHMARKS if args.benchmark == "all" else {args.benchmark: BENCHMARKS[args.benchmark]}
+    for name, bench in selected.items():
+        print(f"--- {name} ---")
+        bench(args.n)
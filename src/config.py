@@ -2,17 +2,30 @@
 """
 Handles loading and parsing of external configuration files, such as security rules.
 """
+import hashlib
+import json
+import os
 import yaml
 
+CONFIG_FILE = "security_rules.yaml"
+
+def _read_config_file() -> tuple[dict | None, str | None]:
+    """Returns the parsed YAML configuration and the SHA-256 of its bytes, or (None, None) if missing."""
+    try:
+        with open(CONFIG_FILE, "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return None, None
+    return yaml.safe_load(raw) or {}, hashlib.sha256(raw).hexdigest()
+
 def load_security_rules():
     """
     Loads transaction rules from the external YAML configuration file.
     """
-    try:
-        with open("security_rules.yaml", "r") as f:
-            config = yaml.safe_load(f)
-            return config.get("transaction_rules", {})
-    except FileNotFoundError:
+    config, _ = _read_config_file()
+    if config is not None:
+        return config.get("transaction_rules", {})
+    else:
         # Fallback to default if config file is missing
         return {
             "max_amount": 10000,
@@ -20,5 +33,130 @@ def load_security_rules():
             "high_value_destination_account": "Account_D",
         }
 
+def load_verifier_settings():
+    """
+    Loads tuning knobs for the verifier (pools, caches, budgets) from the `verifier`
+    section of the YAML configuration file. Missing keys keep their defaults.
+    """
+    settings = {
+        # Number of Z3 contexts (each with its own compiled policy) shared by guardian threads.
+        "context_pool_size": os.cpu_count() or 4,
+        # Optional multiprocessing backend (workers.ProcessVerifier).
+        "process_workers": os.cpu_count() or 4,
+        "process_chunk_size": 512,
+        "process_max_tasks_per_child": 1000,
+        "process_start_method": "spawn",
+        # Per-check Z3 budgets. The rlimit is a deterministic resource count (a typical check uses
+        # a few hundred units); the timeout is a wall-clock backstop. 0 disables a budget.
+        "check_timeout_ms": 1000,
+        "check_rlimit": 1_000_000,
+        # Rolling window behind the window_transfers / window_amount policy variables, kept as
+        # per-destination counters in buckets of velocity_bucket_seconds.
+        "velocity_window_seconds": 24 * 3600,
+        "velocity_bucket_seconds": 3600,
+        # Where `python benchmark.py tactics` records the fastest solver configuration per policy.
+        "solver_tuning_file": "solver_tuning.json",
+        # Stage latency histograms and counters (metrics.py). Off by default; when on, they can be
+        # scraped from a local /metrics endpoint and/or written to a Prometheus textfile.
+        "metrics_enabled": False,
+        "metrics_http_port": 0,
+        "metrics_http_address": "127.0.0.1",
+        "metrics_textfile": None,
+        "metrics_textfile_interval_seconds": 15,
+    }
+    config, _ = _read_config_file()
+    if config is not None:
+        settings.update(config.get("verifier") or {})
+    return settings
+
+def load_policy_rules() -> tuple[list | None, str | None]:
+    """
+    Loads the declarative invariants from the `policy` section of the YAML configuration file,
+    together with the file hash used to cache their compiled form. The rules are None when
+    there is no policy section, in which case the built-in default policy applies.
+    """
+    config, file_hash = _read_config_file()
+    return (config or {}).get("policy"), file_hash
+
+def load_solver_tuning() -> dict[str, str]:
+    """Loads the recorded solver configuration per policy fingerprint, or {} if none was recorded."""
+    try:
+        with open(VERIFIER_SETTINGS["solver_tuning_file"], "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_solver_tuning(policy_fingerprint: str, solver_config: str):
+    """Records the solver configuration to use for a policy."""
+    tuning = load_solver_tuning()
+    tuning[policy_fingerprint] = solver_config
+    with open(VERIFIER_SETTINGS["solver_tuning_file"], "w") as f:
+        json.dump(tuning, f, indent=2, sort_keys=True)
+
+# SQLite tuning presets, selected with `storage: {profile: ...}` in the configuration file.
+STORAGE_PROFILES = {
+    # Write-ahead log so readers never block the writer; NORMAL sync is durable across crashes of
+    # the process (a power loss can drop the last commits, never corrupt the file).
+    "default": {
+        "journal_mode": "wal",
+        "synchronous": "normal",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -16384,  # negative: KiB, i.e. 16 MiB per connection
+        "busy_timeout_ms": 5000,
+        "pool_size": 8,
+        "pool_timeout_seconds": 30,
+    },
+    # WAL with an fsync on every commit.
+    "durable": {
+        "journal_mode": "wal",
+        "synchronous": "full",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -16384,
+        "busy_timeout_ms": 5000,
+        "pool_size": 8,
+        "pool_timeout_seconds": 30,
+    },
+    "low_memory": {
+        "journal_mode": "wal",
+        "synchronous": "normal",
+        "mmap_size": 0,
+        "cache_size": -2000,
+        "busy_timeout_ms": 5000,
+        "pool_size": 2,
+        "pool_timeout_seconds": 30,
+    },
+    # SQLite's own defaults (rollback journal), kept for comparison.
+    "legacy": {
+        "journal_mode": "delete",
+        "synchronous": "full",
+        "mmap_size": 0,
+        "cache_size": -2000,
+        "busy_timeout_ms": 5000,
+        "pool_size": 64,
+        "pool_timeout_seconds": 30,
+    },
+}
+
+def load_storage_settings() -> dict:
+    """
+    Loads the database settings from the `storage` section of the YAML configuration file:
+    the named profile from STORAGE_PROFILES, with any other key in the section overriding it.
+    """
+    config, _ = _read_config_file()
+    section = dict((config or {}).get("storage") or {})
+    profile = section.pop("profile", "default")
+    if profile not in STORAGE_PROFILES:
+        raise ValueError(f"Unknown storage profile '{profile}'. Available profiles: {', '.join(STORAGE_PROFILES)}.")
+    defaults = {
+        "ledger_snapshot_interval": 1000,  # ledger entries between balance snapshots (0 disables them)
+        "group_commit": False,  # route transfers through database.GroupCommitWriter
+        "group_commit_max_batch": 64,
+        "group_commit_max_wait_ms": 0,
+    }
+    return {"profile": profile, **defaults, **STORAGE_PROFILES[profile], **section}
+
 # Load rules on module import to be used as a constant across the application
 SECURITY_RULES = load_security_rules()
+POLICY_RULES, POLICY_SOURCE_HASH = load_policy_rules()
+VERIFIER_SETTINGS = load_verifier_settings()
+STORAGE_SETTINGS = load_storage_settings()
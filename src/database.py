@@ -4,24 +4,191 @@ Manages the SQLite database for the agent's world state, including
 account balances and security-related information.
 """
 
+import queue
 import sqlite3
 import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
 
-# Use a thread-local object to manage database connections for different threads.
-# This is a lightweight solution for web applications.
-local = threading.local()
+from config import STORAGE_SETTINGS
 
 DATABASE_FILE = "sentinel_verifier.db"
 
-def get_db_connection():
+# Money is stored and passed around as integer cents; amounts in tool calls and rules are whole dollars.
+CENTS_PER_DOLLAR = 100
+
+def to_cents(amount) -> int:
+    """Converts a dollar amount to integer cents, exactly for integers and rounded to the nearest cent otherwise."""
+    if isinstance(amount, int):
+        return amount * CENTS_PER_DOLLAR
+    return round(amount * CENTS_PER_DOLLAR)
+
+def format_cents(cents: int) -> str:
+    """Formats integer cents as dollars, e.g. 2500050 -> '$25,000.50'."""
+    sign = "-" if cents < 0 else ""
+    dollars, rest = divmod(abs(cents), CENTS_PER_DOLLAR)
+    return f"{sign}${dollars:,}.{rest:02d}"
+
+# Database files whose schema has already been created/migrated by this process.
+_schema_ready = set()
+_schema_lock = threading.Lock()
+
+# In-process cache of account ID -> stable integer account number, valid for the account-set
+# version it was filled under; cleared when get_accounts_version() sees the version change.
+_account_num_cache: dict[str, int] = {}
+_account_num_cache_version = None
+
+class ConnectionPool:
     """
-    Establishes and returns a database connection.
-    Uses a thread-local object to ensure connection safety across threads.
+    A bounded pool of SQLite connections to one database file, tuned by a storage profile
+    (see STORAGE_PROFILES in config.py). Threads borrow a connection for the duration of one
+    operation instead of keeping one each, so the number of open connections never exceeds
+    `pool_size` however many threads the app runs. Borrowing is re-entrant within a thread.
     """
-    if not hasattr(local, "connection"):
-        local.connection = sqlite3.connect(DATABASE_FILE, check_same_thread=False)
-        local.connection.row_factory = sqlite3.Row
-    return local.connection
+
+    def __init__(self, path: str, settings: dict):
+        self.path = path
+        self.settings = settings
+        self.size = settings["pool_size"]
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._closed = False
+        self.created = self.checked_out = self.waits = 0
+        self.wait_seconds = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        settings = self.settings
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=settings["busy_timeout_ms"] / 1000)
+        conn.row_factory = sqlite3.Row
+        _set_journal_mode(conn, settings['journal_mode'], settings["busy_timeout_ms"] / 1000)
+        conn.execute(f"PRAGMA synchronous = {settings['synchronous']}")
+        conn.execute(f"PRAGMA mmap_size = {int(settings['mmap_size'])}")
+        conn.execute(f"PRAGMA cache_size = {int(settings['cache_size'])}")
+        conn.execute(f"PRAGMA busy_timeout = {int(settings['busy_timeout_ms'])}")
+        with _schema_lock:
+            if self.path not in _schema_ready:
+                create_tables(conn)
+                _schema_ready.add(self.path)
+                _invalidate_account_cache()
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Yields a connection, blocking (up to pool_timeout_seconds) while all of them are in use."""
+        conn = getattr(self._local, "connection", None)
+        if conn is not None:
+            yield conn  # Nested use within one thread shares the borrowed connection.
+            return
+
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self.created < self.size
+                if can_create:
+                    self.created += 1
+            if can_create:
+                try:
+                    conn = self._connect()
+                except BaseException:
+                    with self._lock:
+                        self.created -= 1
+                    raise
+            else:
+                start = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=self.settings["pool_timeout_seconds"])
+                except queue.Empty:
+                    raise sqlite3.OperationalError(
+                        f"No database connection became free within {self.settings['pool_timeout_seconds']}s "
+                        f"(pool_size={self.size}).") from None
+                finally:
+                    with self._lock:
+                        self.waits += 1
+                        self.wait_seconds += time.perf_counter() - start
+
+        with self._lock:
+            self.checked_out += 1
+        self._local.connection = conn
+        try:
+            yield conn
+        finally:
+            del self._local.connection
+            if conn.in_transaction:
+                conn.rollback()  # Never hand a half-finished transaction to the next borrower.
+            with self._lock:
+                self.checked_out -= 1
+                closed = self._closed
+                if closed:
+                    self.created -= 1
+            if closed:
+                conn.close()
+            else:
+                self._idle.put(conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "path": self.path, "profile": self.settings.get("profile"), "size": self.size,
+                "created": self.created, "checked_out": self.checked_out, "idle": self._idle.qsize(),
+                "waits": self.waits, "wait_seconds": self.wait_seconds,
+            }
+
+    def close(self):
+        """Closes the idle connections; connections still borrowed are closed when they come back."""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self.created -= 1
+
+def _set_journal_mode(conn, mode: str, timeout: float):
+    """
+    Switching the journal mode (e.g. a rollback-journal file to WAL) needs an exclusive lock and,
+    unlike other statements, fails at once instead of waiting for it. Retries for up to `timeout`.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            conn.execute(f"PRAGMA journal_mode = {mode}")
+            return
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) or time.monotonic() >= deadline:
+                raise
+            time.sleep(0.005)
+
+_pool: ConnectionPool | None = None
+_pool_lock = threading.Lock()
+
+def _get_pool() -> ConnectionPool:
+    global _pool
+    pool = _pool
+    if pool is None or pool.path != DATABASE_FILE:
+        with _pool_lock:
+            if _pool is None or _pool.path != DATABASE_FILE:
+                if _pool is not None:
+                    _pool.close()
+                _pool = ConnectionPool(DATABASE_FILE, STORAGE_SETTINGS)
+            pool = _pool
+    return pool
+
+def connection():
+    """
+    Borrows a connection to DATABASE_FILE from the pool for the duration of a `with` block.
+    The schema is created or migrated the first time a file is opened.
+    """
+    return _get_pool().connection()
+
+def get_pool_stats() -> dict:
+    """Returns the connection pool's size and how many connections are created, checked out and idle, and how often callers waited."""
+    return _get_pool().stats()
 
 def create_tables(conn):
     """
@@ -31,7 +198,8 @@ def create_tables(conn):
         conn.execute("""
             CREATE TABLE IF NOT EXISTS accounts (
                 id TEXT PRIMARY KEY,
-                balance REAL NOT NULL
+                balance INTEGER NOT NULL,
+                account_num INTEGER
             );
         """)
         conn.execute("""
@@ -39,103 +207,692 @@ def create_tables(conn):
                 id TEXT PRIMARY KEY
             );
         """)
+        # Sliding-window velocity counters: transfers and amount sent to each destination per time bucket.
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS velocity_buckets (
+                destination TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                transfers INTEGER NOT NULL,
+                amount INTEGER NOT NULL,
+                PRIMARY KEY (destination, bucket)
+            ) WITHOUT ROWID;
+        """)
+        # Append-only ledger of every balance change: a transfer is two entries sharing a
+        # transfer_id (the debit, negative, and the credit); direct balance updates are
+        # adjustments without one. seq is the ledger position, amounts are in cents.
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS transfers (
+                seq INTEGER PRIMARY KEY,
+                transfer_id INTEGER,
+                account TEXT NOT NULL,
+                counterparty TEXT,
+                ts REAL NOT NULL,
+                amount INTEGER NOT NULL
+            );
+        """)
+        # Covers history queries by time, so they never touch the table itself.
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_transfers_account_ts
+                ON transfers (account, ts, seq, amount, counterparty, transfer_id);
+        """)
+        # Covers replays, which follow ledger order (seq) from a snapshot.
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_transfers_account_seq ON transfers (account, seq, amount);
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS transfers_no_update BEFORE UPDATE ON transfers
+            BEGIN SELECT RAISE(ABORT, 'The transfers ledger is append-only.'); END;
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS transfers_no_delete BEFORE DELETE ON transfers
+            BEGIN SELECT RAISE(ABORT, 'The transfers ledger is append-only.'); END;
+        """)
+        # Every account's balance as of ledger position seq, taken periodically so that
+        # history queries and audits start from the latest snapshot instead of the beginning.
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS balance_snapshots (
+                account TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                ts REAL NOT NULL,
+                balance INTEGER NOT NULL,
+                PRIMARY KEY (account, seq)
+            ) WITHOUT ROWID;
+        """)
+        # Named counters shared by every process using the file: the next account number and the
+        # account-set and blacklist versions (see migration v4).
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            ) WITHOUT ROWID;
+        """)
+    migrate_schema(conn)
+
+SCHEMA_VERSION = 4
+
+def migrate_schema(conn):
+    """
+    Upgrades databases created by older versions of the schema.
+    Each step runs once, tracked by SQLite's user_version pragma. All pending steps run in one
+    write transaction, and the version is read again once the write lock is held, so concurrent
+    first opens (threads or processes) migrate the file exactly once.
+    """
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            # v1: stable integer surrogate key for each account, used as its Z3 identifier.
+            # Existing accounts are numbered in their original row order.
+            columns = [row['name'] for row in conn.execute("PRAGMA table_info(accounts)")]
+            if "account_num" not in columns:
+                conn.execute("ALTER TABLE accounts ADD COLUMN account_num INTEGER")
+            conn.execute("""
+                UPDATE accounts SET account_num =
+                    (SELECT COUNT(*) FROM accounts AS earlier WHERE earlier.rowid < accounts.rowid)
+                WHERE account_num IS NULL
+            """)
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_accounts_account_num ON accounts (account_num)")
+        if version < 2:
+            # v2: money as integer cents instead of REAL dollars. SQLite cannot change a column's
+            # type, so both tables are rebuilt (keeping rowids, which order the account listing).
+            conn.execute("CREATE TABLE accounts_v2 (id TEXT PRIMARY KEY, balance INTEGER NOT NULL, account_num INTEGER)")
+            conn.execute("""
+                INSERT INTO accounts_v2 (rowid, id, balance, account_num)
+                SELECT rowid, id, CAST(ROUND(balance * 100) AS INTEGER), account_num FROM accounts
+            """)
+            conn.execute("DROP TABLE accounts")
+            conn.execute("ALTER TABLE accounts_v2 RENAME TO accounts")
+            conn.execute("CREATE UNIQUE INDEX idx_accounts_account_num ON accounts (account_num)")
+            conn.execute("""
+                CREATE TABLE velocity_buckets_v2 (
+                    destination TEXT NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    transfers INTEGER NOT NULL,
+                    amount INTEGER NOT NULL,
+                    PRIMARY KEY (destination, bucket)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("""
+                INSERT INTO velocity_buckets_v2 (destination, bucket, transfers, amount)
+                SELECT destination, bucket, transfers, CAST(ROUND(amount * 100) AS INTEGER) FROM velocity_buckets
+            """)
+            conn.execute("DROP TABLE velocity_buckets")
+            conn.execute("ALTER TABLE velocity_buckets_v2 RENAME TO velocity_buckets")
+        if version < 3:
+            # v3: the transfers ledger starts empty, so existing balances become each account's
+            # opening snapshot at ledger position 0.
+            conn.execute(
+                "INSERT OR IGNORE INTO balance_snapshots (account, seq, ts, balance) SELECT id, 0, ?, balance FROM accounts",
+                (time.time(),)
+            )
+        if version < 4:
+            # v4: account numbers come from a counter and are never reused, and the account-set and
+            # blacklist versions live in the database, bumped by triggers in the writing transaction,
+            # so every process sees every change. Versions start at a random value so that those of
+            # different database files do not collide in the caches keyed by them.
+            conn.execute("""
+                INSERT OR IGNORE INTO counters (name, value) VALUES
+                    ('next_account_num', (SELECT COALESCE(MAX(account_num), -1) + 1 FROM accounts)),
+                    ('accounts_version', abs(random() % 1000000000)),
+                    ('blacklist_version', abs(random() % 1000000000))
+            """)
+            for table, counter in (("accounts", "accounts_version"), ("blacklisted_accounts", "blacklist_version")):
+                for event in ("INSERT", "DELETE"):
+                    conn.execute(f"""
+                        CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_version AFTER {event} ON {table}
+                        BEGIN UPDATE counters SET value = value + 1 WHERE name = '{counter}'; END;
+                    """)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
 
 def initialize_database():
     """
     Populates the database with initial data if it's empty.
     This function is idempotent and safe to run multiple times.
     """
-    conn = get_db_connection()
-
-    # Check if accounts table is empty
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM accounts")
-    if cursor.fetchone()[0] == 0:
-        print("Initializing database with default accounts...")
-        initial_accounts = {
-            "USER_ACCOUNT": {"balance": 25000},
-            "Account_A": {"balance": 1000},
-            "Account_B": {"balance": 5000},
-            "Account_C": {"balance": 0},
-            "Account_D": {"balance": 100000},
-        }
-        with conn:
+    with connection() as conn:
+        # Check if accounts table is empty
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM accounts")
+        if cursor.fetchone()[0] == 0:
+            print("Initializing database with default accounts...")
+            initial_accounts = {
+                "USER_ACCOUNT": {"balance": 25000},
+                "Account_A": {"balance": 1000},
+                "Account_B": {"balance": 5000},
+                "Account_C": {"balance": 0},
+                "Account_D": {"balance": 100000},
+            }
             for acc_id, data in initial_accounts.items():
-                conn.execute(
-                    "INSERT INTO accounts (id, balance) VALUES (?, ?)",
-                    (acc_id, data["balance"])
-                )
-
-    # Check if blacklisted_accounts table is empty
-    cursor.execute("SELECT COUNT(*) FROM blacklisted_accounts")
-    if cursor.fetchone()[0] == 0:
-        print("Initializing database with default blacklisted accounts...")
-        initial_blacklist = ["Account_X", "Account_Y", "ILLEGAL_ACCOUNT"]
-        with conn:
+                add_account(acc_id, to_cents(data["balance"]))
+
+        # Check if blacklisted_accounts table is empty
+        cursor.execute("SELECT COUNT(*) FROM blacklisted_accounts")
+        if cursor.fetchone()[0] == 0:
+            print("Initializing database with default blacklisted accounts...")
+            initial_blacklist = ["Account_X", "Account_Y", "ILLEGAL_ACCOUNT"]
             for acc_id in initial_blacklist:
-                conn.execute(
-                    "INSERT INTO blacklisted_accounts (id) VALUES (?)",
-                    (acc_id,)
-                )
-
-def get_account_balance(account_id: str) -> float | None:
-    """Retrieves the balance of a specific account."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT balance FROM accounts WHERE id = ?", (account_id,))
-    row = cursor.fetchone()
-    return row['balance'] if row else None
-
-def update_account_balance(account_id: str, new_balance: float):
-    """Updates the balance of a specific account."""
-    conn = get_db_connection()
-    with conn:
-        conn.execute(
-            "UPDATE accounts SET balance = ? WHERE id = ?",
-            (new_balance, account_id)
-        )
+                add_blacklisted_account(acc_id)
+
+def get_account_balance(account_id: str) -> int | None:
+    """Retrieves the balance of a specific account, in cents."""
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT balance FROM accounts WHERE id = ?", (account_id,))
+        row = cursor.fetchone()
+        return row['balance'] if row else None
+
+def update_account_balance(account_id: str, new_balance: int):
+    """Updates the balance of a specific account, in cents, recording the difference in the ledger as an adjustment."""
+    with connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT balance FROM accounts WHERE id = ?", (account_id,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE accounts SET balance = ? WHERE id = ?", (new_balance, account_id))
+                _append_entries(conn, time.time(), None, [(account_id, None, new_balance - row['balance'])])
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+def transfer(sender_id: str, destination_id: str, amount: int, velocity: tuple[int, int] | None = None) -> tuple[bool, str]:
+    """
+    Moves `amount` cents from sender to destination in a single write transaction.
+    BEGIN IMMEDIATE takes the write lock before anything is read, and the debit only
+    applies while the sender's balance covers it, so concurrent transfers can neither
+    lose an update nor overdraw the account. Failures are detected by row count and
+    roll the whole transfer back. The ledger entries are written in the same transaction, as is
+    the destination's velocity count when `velocity` gives the (bucket, window_start) to record it in.
+    With `group_commit` enabled in the storage settings, the transfer is handed to the
+    group-commit writer and shares its transaction with concurrent ones.
+    Returns (success, reason).
+    """
+    if not amount > 0:
+        return False, "Transfer amount must be positive."
+    if STORAGE_SETTINGS["group_commit"]:
+        return get_group_commit_writer().submit(sender_id, destination_id, amount, velocity).result()
+    with connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = _apply_transfer(conn, sender_id, destination_id, amount, time.time(), velocity)
+            if result[0]:
+                conn.commit()
+            else:
+                conn.rollback()
+        except BaseException:
+            conn.rollback()
+            raise
+    return result
+
+def _apply_transfer(conn, sender_id: str, destination_id: str, amount: int, ts: float,
+                    velocity: tuple[int, int] | None = None) -> tuple[bool, str]:
+    """Applies a transfer inside the caller's write transaction, which must be rolled back if it fails."""
+    debited = conn.execute(
+        "UPDATE accounts SET balance = balance - ? WHERE id = ? AND balance >= ?",
+        (amount, sender_id, amount)
+    ).rowcount
+    if debited == 0:
+        if conn.execute("SELECT 1 FROM accounts WHERE id = ?", (sender_id,)).fetchone() is None:
+            return False, "Sender or destination account not found."
+        return False, f"Insufficient funds in '{sender_id}' for a transfer of {format_cents(amount)}."
+    credited = conn.execute(
+        "UPDATE accounts SET balance = balance + ? WHERE id = ?",
+        (amount, destination_id)
+    ).rowcount
+    if credited == 0:
+        return False, "Sender or destination account not found."
+    _append_entries(conn, ts, True, [(sender_id, destination_id, -amount), (destination_id, sender_id, amount)])
+    if velocity is not None:
+        _record_velocity(conn, destination_id, amount, *velocity)
+    return True, f"Transferred {format_cents(amount)} from {sender_id} to {destination_id}."
+
+class GroupCommitWriter:
+    """
+    A dedicated writer thread that applies queued transfers in batches, one write transaction
+    (and so one commit and WAL sync) per batch instead of one per transfer. Once a transfer
+    arrives, the writer waits up to `max_wait` seconds for more, up to `max_batch` in total.
+    Each transfer runs in its own savepoint, so a failed one is undone without affecting the
+    rest of the batch; its caller's future resolves to the same (success, reason) as transfer().
+    """
+
+    def __init__(self, max_batch: int, max_wait: float):
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.batches = self.operations = 0
+        self._thread = threading.Thread(target=self._run, name="db-group-commit", daemon=True)
+        self._thread.start()
+
+    def submit(self, sender_id: str, destination_id: str, amount: int, velocity: tuple[int, int] | None = None) -> Future:
+        """Queues a transfer of `amount` cents (see transfer()); the returned future resolves to (success, reason)."""
+        future = Future()
+        if not amount > 0:
+            future.set_result((False, "Transfer amount must be positive."))
+            return future
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The group-commit writer is closed.")
+            self._queue.put((sender_id, destination_id, amount, velocity, future))
+        return future
+
+    def _run(self):
+        running = True
+        while running:
+            operation = self._queue.get()
+            if operation is None:
+                break
+            batch = [operation]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    operation = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if operation is None:
+                    running = False
+                    break
+                batch.append(operation)
+            self._commit(batch)
+
+    def _commit(self, batch: list[tuple]):
+        try:
+            results = []
+            with connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    ts = time.time()
+                    for sender_id, destination_id, amount, velocity, _ in batch:
+                        conn.execute("SAVEPOINT group_commit_operation")
+                        result = _apply_transfer(conn, sender_id, destination_id, amount, ts, velocity)
+                        if not result[0]:
+                            conn.execute("ROLLBACK TO group_commit_operation")
+                        conn.execute("RELEASE group_commit_operation")
+                        results.append(result)
+                    conn.commit()
+                except BaseException:
+                    conn.rollback()
+                    raise
+        except Exception as e:
+            for *_, future in batch:
+                future.set_exception(e)
+            return
+        with self._lock:
+            self.batches += 1
+            self.operations += len(batch)
+        for (*_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def stats(self) -> dict:
+        """Returns how many batches were committed, the transfers they held, and the transfers still queued."""
+        with self._lock:
+            return {"batches": self.batches, "operations": self.operations, "queued": self._queue.qsize()}
+
+    def close(self):
+        """Applies the transfers already queued, then stops the writer thread."""
+        with self._lock:
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+
+_writer: GroupCommitWriter | None = None
+_writer_lock = threading.Lock()
+
+def get_group_commit_writer() -> GroupCommitWriter:
+    """Returns the process's group-commit writer, starting it (from the storage settings) on first use."""
+    global _writer
+    writer = _writer
+    if writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = GroupCommitWriter(STORAGE_SETTINGS["group_commit_max_batch"],
+                                            STORAGE_SETTINGS["group_commit_max_wait_ms"] / 1000)
+            writer = _writer
+    return writer
+
+def _append_entries(conn, ts: float, is_transfer: bool | None, entries: list[tuple]):
+    """
+    Appends (account, counterparty, amount) entries to the ledger; the entries of a transfer share
+    the transfer_id of its first entry. Every `ledger_snapshot_interval` entries, all balances are
+    snapshotted in the same transaction.
+    """
+    end, ts = _ledger_end(conn, ts)
+    first = end + 1
+    transfer_id = first if is_transfer else None
+    conn.executemany(
+        "INSERT INTO transfers (seq, transfer_id, account, counterparty, ts, amount) VALUES (?, ?, ?, ?, ?, ?)",
+        [(first + i, transfer_id, account, counterparty, ts, amount) for i, (account, counterparty, amount) in enumerate(entries)]
+    )
+    last = first + len(entries) - 1
+    interval = STORAGE_SETTINGS["ledger_snapshot_interval"]
+    if interval and last // interval != (first - 1) // interval:
+        _snapshot_balances(conn, last, ts)
+
+def _ledger_end(conn, ts: float) -> tuple[int, float]:
+    """
+    Returns the last ledger position and the time to stamp an entry or snapshot appended there:
+    `ts`, or the last entry's time if the clock has stepped back since, so that times never
+    decrease along the ledger and time order agrees with seq order. Call with the write lock held.
+    """
+    last = conn.execute("SELECT seq, ts FROM transfers ORDER BY seq DESC LIMIT 1").fetchone()
+    if last is None:
+        return 0, ts
+    return last[0], max(ts, last[1])
+
+def _snapshot_balances(conn, seq: int, ts: float):
+    conn.execute(
+        "INSERT OR REPLACE INTO balance_snapshots (account, seq, ts, balance) SELECT id, ?, ?, balance FROM accounts",
+        (seq, ts)
+    )
+
+def take_balance_snapshot() -> int:
+    """Snapshots every account's balance at the current end of the ledger and returns that ledger position."""
+    with connection() as conn, conn:
+        conn.execute("BEGIN IMMEDIATE")
+        seq, ts = _ledger_end(conn, time.time())
+        _snapshot_balances(conn, seq, ts)
+    return seq
+
+def get_transfer_history(account_id: str, since: float | None = None, until: float | None = None, limit: int = 100) -> list[dict]:
+    """
+    Returns the account's ledger entries with since <= ts <= until, newest first: seq, transfer_id
+    (None for adjustments), counterparty, ts and the signed amount in cents. Served from the
+    covering (account, ts) index.
+    """
+    with connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT seq, transfer_id, counterparty, ts, amount FROM transfers
+            WHERE account = ? AND ts >= ? AND ts <= ?
+            ORDER BY ts DESC, seq DESC LIMIT ?
+            """,
+            (account_id, float("-inf") if since is None else since, float("inf") if until is None else until, limit)
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+def get_balance_at(account_id: str, ts: float) -> int | None:
+    """
+    Replays the account's balance in cents as of time ts. The ledger is ordered by seq, so ts only
+    picks the ledger position: that of the account's latest entry or snapshot stamped at or
+    before ts (stamps never decrease along the ledger, see _ledger_end). The balance there is the
+    latest snapshot up to that position plus the account's entries after it. None if the
+    account has neither that early.
+    """
+    with connection() as conn:
+        position = conn.execute(
+            """
+            SELECT MAX(seq) FROM (
+                SELECT * FROM (SELECT seq FROM transfers WHERE account = :account AND ts <= :ts
+                               ORDER BY ts DESC, seq DESC LIMIT 1)
+                UNION ALL
+                SELECT * FROM (SELECT seq FROM balance_snapshots WHERE account = :account AND ts <= :ts
+                               ORDER BY ts DESC, seq DESC LIMIT 1)
+            )
+            """,
+            {"account": account_id, "ts": ts}
+        ).fetchone()[0]
+        if position is None:
+            return None
+        snapshot = conn.execute(
+            "SELECT seq, balance FROM balance_snapshots WHERE account = ? AND seq <= ? ORDER BY seq DESC LIMIT 1",
+            (account_id, position)
+        ).fetchone()
+        if snapshot is None:
+            return None
+        delta = conn.execute(
+            "SELECT COALESCE(SUM(amount), 0) FROM transfers WHERE account = ? AND seq > ? AND seq <= ?",
+            (account_id, snapshot['seq'], position)
+        ).fetchone()[0]
+    return snapshot['balance'] + delta
+
+def audit_balances() -> dict[str, tuple[int, int | None]]:
+    """
+    Replays every account from its latest snapshot through the rest of the ledger and compares
+    the result with the materialized balance. Returns {account: (balance, replayed)} for each
+    account that disagrees; an empty dict means the ledger accounts for every balance.
+    """
+    with connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT accounts.id, accounts.balance, latest.balance + COALESCE((
+                SELECT SUM(amount) FROM transfers WHERE account = accounts.id AND seq > latest.seq
+            ), 0) AS replayed
+            FROM accounts
+            LEFT JOIN balance_snapshots AS latest ON latest.account = accounts.id AND latest.seq = (
+                SELECT MAX(seq) FROM balance_snapshots WHERE account = accounts.id
+            )
+            """
+        ).fetchall()
+    return {row['id']: (row['balance'], row['replayed']) for row in rows if row['balance'] != row['replayed']}
 
 def account_exists(account_id: str) -> bool:
     """Checks if an account exists in the database."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT 1 FROM accounts WHERE id = ?", (account_id,))
-    return cursor.fetchone() is not None
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM accounts WHERE id = ?", (account_id,))
+        return cursor.fetchone() is not None
 
 def is_account_blacklisted(account_id: str) -> bool:
     """Checks if an account is blacklisted."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT 1 FROM blacklisted_accounts WHERE id = ?", (account_id,))
-    return cursor.fetchone() is not None
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM blacklisted_accounts WHERE id = ?", (account_id,))
+        return cursor.fetchone() is not None
+
+def add_account(account_id: str, balance: int):
+    """Creates an account with the given balance in cents and a new account number, never used before in this database."""
+    with connection() as conn, conn:
+        conn.execute(
+            """
+            INSERT INTO accounts (id, balance, account_num)
+            VALUES (?, ?, (SELECT value FROM counters WHERE name = 'next_account_num'))
+            """,
+            (account_id, balance)
+        )
+        conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'next_account_num'")
+        # The opening balance is the account's first snapshot, at the current end of the ledger.
+        seq, ts = _ledger_end(conn, time.time())
+        conn.execute(
+            "INSERT OR REPLACE INTO balance_snapshots (account, seq, ts, balance) VALUES (?, ?, ?, ?)",
+            (account_id, seq, ts, balance)
+        )
+    _invalidate_account_cache()
+
+def remove_account(account_id: str):
+    """Deletes an account from the database."""
+    with connection() as conn, conn:
+        conn.execute("DELETE FROM accounts WHERE id = ?", (account_id,))
+    _invalidate_account_cache()
+
+def get_account_num(account_id: str) -> int | None:
+    """
+    Returns the stable integer number of an account, or None if it does not exist.
+    Served from an in-process cache after the first lookup of each account.
+    """
+    num = _account_num_cache.get(account_id)
+    if num is None:
+        with connection() as conn:
+            row = conn.execute("SELECT account_num FROM accounts WHERE id = ?", (account_id,)).fetchone()
+        if row is None:
+            return None
+        num = _account_num_cache[account_id] = row['account_num']
+    return num
+
+def get_transfer_snapshot(destination_id: str, sender_id: str | None = None, window_start: int | None = None) -> dict:
+    """
+    Fetches everything the guardian needs about a transfer in a single query: the
+    destination's account number (None if it does not exist) and blacklist status, the
+    sender's account number and balance in cents (None if it does not exist), and the transfers
+    and amount in cents sent to the destination in velocity buckets >= window_start (0 if omitted).
+    When the destination is missing, `available_accounts` lists every account ID for the error message.
+    The account-set and blacklist versions all of this was read under come with it, so a guardian
+    check needs no other round trip to key its caches.
+    """
+    with connection() as conn:
+        row = conn.execute(
+            """
+            SELECT
+                destination.account_num AS destination_num,
+                EXISTS (SELECT 1 FROM blacklisted_accounts WHERE id = :destination) AS destination_blacklisted,
+                sender.account_num AS sender_num,
+                sender.balance AS sender_balance,
+                (SELECT COALESCE(SUM(transfers), 0) FROM velocity_buckets
+                    WHERE destination = :destination AND bucket >= :window_start) AS window_transfers,
+                (SELECT COALESCE(SUM(amount), 0) FROM velocity_buckets
+                    WHERE destination = :destination AND bucket >= :window_start) AS window_amount,
+                CASE WHEN destination.id IS NULL THEN
+                    (SELECT COALESCE(group_concat(id, ', '), '') FROM (SELECT id FROM accounts ORDER BY rowid))
+                END AS available_accounts,
+                (SELECT value FROM counters WHERE name = 'accounts_version') AS accounts_version,
+                (SELECT value FROM counters WHERE name = 'blacklist_version') AS blacklist_version
+            FROM (SELECT 1)
+            LEFT JOIN accounts AS destination ON destination.id = :destination
+            LEFT JOIN accounts AS sender ON sender.id = :sender
+            """,
+            {"destination": destination_id, "sender": sender_id, "window_start": window_start},
+        ).fetchone()
+    snapshot = dict(row)
+    snapshot["destination_blacklisted"] = bool(snapshot["destination_blacklisted"])
+    _note_accounts_version(snapshot["accounts_version"])
+    # Seed the account-number cache so later lookups of either account skip the database.
+    if snapshot["destination_num"] is not None:
+        _account_num_cache[destination_id] = snapshot["destination_num"]
+    if snapshot["sender_num"] is not None:
+        _account_num_cache[sender_id] = snapshot["sender_num"]
+    return snapshot
+
+def _record_velocity(conn, destination_id: str, amount: int, bucket: int, window_start: int):
+    """Adds a transfer of `amount` cents to the destination's velocity bucket and drops its buckets older than window_start."""
+    conn.execute(
+        """
+        INSERT INTO velocity_buckets (destination, bucket, transfers, amount) VALUES (?, ?, 1, ?)
+        ON CONFLICT (destination, bucket) DO UPDATE
+            SET transfers = transfers + 1, amount = amount + excluded.amount
+        """,
+        (destination_id, bucket, amount)
+    )
+    conn.execute("DELETE FROM velocity_buckets WHERE destination = ? AND bucket < ?", (destination_id, window_start))
+
+def get_velocity_windows(window_start: int) -> dict[str, tuple[int, int]]:
+    """Returns (transfers, amount in cents) sent to each destination in velocity buckets >= window_start."""
+    with connection() as conn:
+        rows = conn.execute(
+            "SELECT destination, SUM(transfers) AS transfers, SUM(amount) AS amount FROM velocity_buckets WHERE bucket >= ? GROUP BY destination",
+            (window_start,)
+        ).fetchall()
+        return {row['destination']: (row['transfers'], row['amount']) for row in rows}
+
+# Guardian checks get the account-set and blacklist versions with their transfer snapshot; other
+# callers read them through a connection of their own: its PRAGMA data_version only changes after
+# another connection commits to the file, so the counters are re-read only after some write.
+_versions_watch: dict | None = None
+_versions_lock = threading.Lock()
+
+def _read_versions() -> tuple[int, int]:
+    """Returns the (accounts, blacklist) versions of DATABASE_FILE."""
+    global _versions_watch
+    with _versions_lock:
+        watch = _versions_watch
+        if watch is None or watch["path"] != DATABASE_FILE:
+            with connection():
+                pass  # Creates or migrates the schema on the first open of the file.
+            if watch is not None:
+                watch["conn"].close()
+            conn = sqlite3.connect(DATABASE_FILE, check_same_thread=False, timeout=STORAGE_SETTINGS["busy_timeout_ms"] / 1000)
+            watch = _versions_watch = {"path": DATABASE_FILE, "conn": conn, "data_version": None, "versions": None}
+        data_version = watch["conn"].execute("PRAGMA data_version").fetchone()[0]
+        if data_version != watch["data_version"]:
+            counters = dict(watch["conn"].execute(
+                "SELECT name, value FROM counters WHERE name IN ('accounts_version', 'blacklist_version')"
+            ).fetchall())
+            watch["versions"] = counters["accounts_version"], counters["blacklist_version"]
+            watch["data_version"] = data_version
+        return watch["versions"]
+
+def _close_versions_watch():
+    global _versions_watch
+    with _versions_lock:
+        if _versions_watch is not None:
+            _versions_watch["conn"].close()
+            _versions_watch = None
+
+def get_accounts_version() -> int:
+    """
+    Returns a counter, stored in the database, that changes whenever any process inserts or
+    removes accounts. Also drops the account-number cache when it has changed.
+    """
+    version = _read_versions()[0]
+    _note_accounts_version(version)
+    return version
+
+def _note_accounts_version(version: int):
+    """Drops the account-number cache if it was filled under another accounts version."""
+    global _account_num_cache_version
+    if version != _account_num_cache_version:
+        _invalidate_account_cache()
+        _account_num_cache_version = version
+
+def _invalidate_account_cache():
+    global _account_num_cache_version
+    _account_num_cache.clear()
+    _account_num_cache_version = None
 
 def get_all_accounts() -> list[dict]:
-    """Retrieves all accounts from the database."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, balance FROM accounts")
-    return [dict(row) for row in cursor.fetchall()]
+    """Retrieves all accounts from the database, with balances in cents."""
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, balance, account_num FROM accounts")
+        return [dict(row) for row in cursor.fetchall()]
+
+def add_blacklisted_account(account_id: str):
+    """Adds an account to the security blacklist."""
+    with connection() as conn, conn:
+        conn.execute("INSERT OR IGNORE INTO blacklisted_accounts (id) VALUES (?)", (account_id,))
+
+def remove_blacklisted_account(account_id: str):
+    """Removes an account from the security blacklist."""
+    with connection() as conn, conn:
+        conn.execute("DELETE FROM blacklisted_accounts WHERE id = ?", (account_id,))
+
+def get_blacklist_version() -> int:
+    """Returns a counter, stored in the database, that changes whenever any process modifies the blacklist."""
+    return _read_versions()[1]
 
 def get_all_blacklisted_accounts() -> list[str]:
     """Retrieves all blacklisted account IDs."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM blacklisted_accounts")
-    return [row['id'] for row in cursor.fetchall()]
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM blacklisted_accounts")
+        return [row['id'] for row in cursor.fetchall()]
 
 def close_db_connection(exception=None):
     """
-    Closes the database connection if it exists in the thread-local context.
+    Stops the group-commit writer, if one is running, and closes the pooled connections to the
+    current database. The next operation opens a new pool.
     """
-    if hasattr(local, "connection"):
-        local.connection.close()
-        del local.connection
+    global _pool, _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+    _close_versions_watch()
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
 
 # Main block to set up the database for the first time
 if __name__ == "__main__":
     print("Setting up database...")
-    db_conn = get_db_connection()
-    create_tables(db_conn)
+    with connection() as db_conn:
+        create_tables(db_conn)
     initialize_database()
     close_db_connection()
     print("Database setup complete.")
@@ -0,0 +1,264 @@
+# fuzz.py
+"""
+Differential fuzzing of the verifier's fast paths against the Z3 semantics.
+Run from the src/ directory, e.g. `python fuzz.py -n 1000000`.
+
+Transactions are generated from the active policy, clustered around its constants
+(each threshold and limit, ±1, and values a few steps away), zero, negative amounts, amounts too large for the
+vectorized pre-screen, unauthorized senders and boundary account state. Money state is drawn in
+whole cents (as stored) a cent either side of each constant, alone or offset by the amount. Each case is
+answered by CompiledPolicy.check() (the reference, proven once per distinct case) and by every fast-path backend,
+in parallel worker processes. A backend agrees when it gives the same verdict and
+names the same violated rule. Disagreements are shrunk to a minimal reproducer.
+"""
+import argparse
+import math
+import multiprocessing
+import random
+import sys
+import time
+
+from z3 import Context
+
+from config import VERIFIER_SETTINGS
+import database as db
+import policy as policy_dsl
+import verifier
+
+FUZZ_ACCOUNTS = ["USER_ACCOUNT", "Account_A", "Account_B", "Account_C", "Account_D"] + [f"Account_{i}" for i in range(5)]
+FUZZ_ID_MAP = {name: i for i, name in enumerate(FUZZ_ACCOUNTS)}
+
+# --- Backends ---
+# Each takes the compiled policy and a list of (amount, destination ID, sender ID, state) rows
+# and returns, per row, (is_safe, [first violated rule]) or None where it defers to Z3.
+
+def _decide(policy, rows):
+    return [policy.decide(*row) for row in rows]
+
+def _prescreen(policy, rows):
+    amounts, destinations, senders, states = zip(*rows)
+    columns = {name: [state[name] for state in states] for name in policy.state_variables}
+    statuses, violated = policy.prescreen(amounts, destinations, senders, columns)
+    return [
+        None if status == verifier.PRESCREEN_UNDECIDED
+        else (True, []) if status == verifier.PRESCREEN_ACCEPT
+        else (False, [policy.rule_ids[mask.argmax()]])
+        for status, mask in zip(statuses, violated)
+    ]
+
+def _scalar(policy, rows):
+    rules = policy.program.scalar_rules(policy.account_ids)
+    verdicts = []
+    for amount, destination, sender, state in rows:
+        violated = next((rule_id for rule_id, holds in rules if not holds(amount, destination, sender, state)), None)
+        verdicts.append((True, []) if violated is None else (False, [violated]))
+    return verdicts
+
+BACKENDS = {"decide": _decide, "prescreen": _prescreen, "scalar": _scalar}
+
+# Z3 answers per distinct case, kept across chunks. Boundary-heavy generation repeats cases
+# often, and the reference verdict of a case never changes, so each is proven only once.
+_proofs = {}
+_MAX_PROOFS = 1_000_000
+
+def _reference(policy, rows):
+    verdicts = []
+    for row in rows:
+        amount, destination, sender, state = row
+        key = (amount, destination, sender, *state.values())
+        verdict = _proofs.get(key)
+        if verdict is None:
+            verdict = _proofs[key] = policy.check(*row)
+        verdicts.append(verdict)
+    return verdicts
+
+# --- Case generation ---
+
+def boundary_values(program) -> list[int]:
+    """The values the fuzzer favours: every rule constant (rounded both ways) ±1, zero and small negatives."""
+    constants = [bound for c in program.constants() for bound in (math.floor(c), math.ceil(c))]
+    return sorted({c + offset for c in constants + [0] for offset in (-1, 0, 1)} | {-2})
+
+def money_boundaries(program) -> list[int]:
+    """The money values the fuzzer favours, in cents: every rule constant and zero, ±1 cent."""
+    cents = [round(policy_dsl.exact(c) * db.CENTS_PER_DOLLAR) for c in program.constants()]
+    return sorted({c + offset for c in cents + [0] for offset in (-1, 0, 1)})
+
+def policy_state(program, raw: dict) -> dict:
+    """Converts account state as stored (money in integer cents) into the values the verifier passes to the rules."""
+    return verifier._policy_state({verifier._SNAPSHOT_FIELDS[name]: value for name, value in raw.items()}, program.state_variables)
+
+def generate_cases(program, n: int, rng: random.Random) -> list[tuple]:
+    """Generates n (amount, destination ID, sender ID, state) rows shaped by the policy."""
+    boundaries = boundary_values(program)
+    money = money_boundaries(program)
+    span = 2 * max(abs(c) for c in boundaries)
+    accounts = list(FUZZ_ID_MAP.values())
+    user = FUZZ_ID_MAP["USER_ACCOUNT"]
+    huge = 2 ** 53  # beyond the pre-screen's exact range
+
+    def value():
+        roll = rng.random()
+        if roll < 0.6:
+            return rng.choice(boundaries)
+        if roll < 0.9:
+            return rng.choice(boundaries) + rng.randint(-16, 16)
+        if roll < 0.92:
+            return rng.choice((huge, huge + 1, -huge, 10 ** 30))
+        return rng.randint(-span, span)
+
+    def cents(amount):
+        roll = rng.random()
+        if roll < 0.3:
+            return rng.choice(money)
+        if roll < 0.6:
+            # Where a constant is reached once the amount is added to or taken from the state.
+            return rng.choice(money) + rng.choice((-1, 1)) * amount * db.CENTS_PER_DOLLAR
+        return value() * db.CENTS_PER_DOLLAR + rng.randint(-db.CENTS_PER_DOLLAR + 1, db.CENTS_PER_DOLLAR - 1)
+
+    rows = []
+    for _ in range(n):
+        amount = value()
+        raw = {name: abs(value()) if name == "window_transfers" else cents(amount) for name in program.state_variables}
+        rows.append((amount, rng.choice(accounts), user if rng.random() < 0.85 else rng.choice(accounts),
+                     policy_state(program, raw)))
+    return rows
+
+# --- Worker processes ---
+
+_policy = None
+
+def _worker_policy():
+    global _policy
+    if _policy is None:
+        _policy = verifier.CompiledPolicy(verifier._current_program(), FUZZ_ID_MAP, Context())
+        _policy.admissible_intervals()
+    return _policy
+
+def _fuzz_chunk(task):
+    """Runs one chunk of cases through the reference and every backend; returns timings and disagreements."""
+    seed, n, backends = task
+    policy = _worker_policy()
+    rows = generate_cases(policy.program, n, random.Random(seed))
+    if len(_proofs) > _MAX_PROOFS:
+        _proofs.clear()
+    start = time.perf_counter()
+    proven = len(_proofs)
+    expected = _reference(policy, rows)
+    timings = {"z3": time.perf_counter() - start}
+    deferred = {}
+    disagreements = []
+    for name in backends:
+        start = time.perf_counter()
+        got = BACKENDS[name](policy, rows)
+        timings[name] = time.perf_counter() - start
+        deferred[name] = sum(verdict is None for verdict in got)
+        for row, want, verdict in zip(rows, expected, got):
+            if verdict is not None and _disagrees(want, verdict):
+                disagreements.append((name, minimize(policy, name, row)))
+                break  # one reproducer per backend and chunk is enough
+    return n, len(_proofs) - proven, timings, deferred, disagreements
+
+def _disagrees(want, got) -> bool:
+    return want[0] != got[0] or want[1][:1] != got[1][:1]
+
+# --- Minimization ---
+
+def _differs(policy, backend: str, row: tuple) -> bool:
+    got = BACKENDS[backend](policy, [row])[0]
+    return got is not None and _disagrees(policy.check(*row), got)
+
+def _simpler(value, boundaries):
+    """Candidate replacements for a failing value, simplest first."""
+    candidates = [0] + sorted(boundaries, key=abs) + [value // 2, value - (value > 0) + (value < 0)]
+    return [c for c in candidates if abs(c) < abs(value) or (abs(c) == abs(value) and c > value)]
+
+def minimize(policy, backend: str, row: tuple) -> tuple:
+    """
+    Greedily shrinks a disagreeing row: each field in turn is replaced by the simplest value
+    (zero, a policy boundary, half its size) that still makes the backend disagree with Z3.
+    """
+    boundaries = boundary_values(policy.program)
+    money = money_boundaries(policy.program)
+    amount, destination, sender, state = row
+    # Money state is shrunk in cents, as generated, so that its fractional part is kept.
+    fields = {"amount": amount, "destination": destination, "sender": sender,
+              **{name: int(value * db.CENTS_PER_DOLLAR) if name in verifier._CENT_VARIABLES else value
+                 for name, value in state.items()}}
+
+    def rebuild(values):
+        return (values["amount"], values["destination"], values["sender"],
+                policy_state(policy.program, {name: values[name] for name in state}))
+
+    changed = True
+    while changed:
+        changed = False
+        for name, value in fields.items():
+            if name in ("destination", "sender"):
+                candidates = list(range(value))
+            elif name in verifier._CENT_VARIABLES:
+                candidates = _simpler(value, money)
+            else:
+                candidates = _simpler(int(value), boundaries)
+            for candidate in candidates:
+                trial = {**fields, name: candidate}
+                if _differs(policy, backend, rebuild(trial)):
+                    fields, changed = trial, True
+                    break
+    return rebuild(fields)
+
+def reproducer(policy, backend: str, row: tuple) -> str:
+    names = {num: name for name, num in FUZZ_ID_MAP.items()}
+    amount, destination, sender, state = row
+    return (f"{backend}: amount={amount}, destination={names[destination]} ({destination}), "
+            f"sender={names[sender]} ({sender}), state={state}\n"
+            f"  z3 -> {policy.check(*row)}, {backend} -> {BACKENDS[backend](policy, [row])[0]}")
+
+# --- Driver ---
+
+def run(n: int, workers: int, chunk_size: int, seed: int, backends: list[str]) -> int:
+    """Fuzzes n cases and prints throughput and reproducers. Returns the number of disagreements."""
+    tasks = [(seed * 1_000_003 + i, min(chunk_size, n - start), backends)
+             for i, start in enumerate(range(0, n, chunk_size))]
+    totals = dict.fromkeys(["z3", *backends], 0.0)
+    deferred = dict.fromkeys(backends, 0)
+    disagreements = {}
+    cases = proofs = 0
+
+    ctx = multiprocessing.get_context(VERIFIER_SETTINGS["process_start_method"])
+    start = time.perf_counter()
+    with ctx.Pool(processes=workers) as pool:
+        for count, proven, timings, chunk_deferred, chunk_disagreements in pool.imap_unordered(_fuzz_chunk, tasks):
+            cases += count
+            proofs += proven
+            for name, elapsed in timings.items():
+                totals[name] += elapsed
+            for name, skipped in chunk_deferred.items():
+                deferred[name] += skipped
+            for name, row in chunk_disagreements:
+                disagreements.setdefault(name, row)
+    elapsed = time.perf_counter() - start
+
+    print(f"{cases:,} cases in {elapsed:.1f} s with {workers} process(es): {cases / elapsed * 60:,.0f} cases/min, "
+          f"{proofs:,} distinct cases proven by Z3")
+    for name, total in totals.items():
+        note = f", {deferred[name]:,} deferred to Z3" if deferred.get(name) else ""
+        print(f"  {name:<10} {total / cases * 1e6:>8.2f} us/case{note}")
+
+    policy = _worker_policy()
+    for name in backends:
+        if name in disagreements:
+            print("DISAGREEMENT " + reproducer(policy, name, disagreements[name]))
+        else:
+            print(f"  {name}: agrees with Z3 on every case")
+    return len(disagreements)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=1_000_000, help="Number of cases.")
+    parser.add_argument("--workers", type=int, default=VERIFIER_SETTINGS["process_workers"], help="Worker processes.")
+    parser.add_argument("--chunk-size", type=int, default=20_000, help="Cases per work item.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backends", nargs="+", choices=sorted(BACKENDS), default=sorted(BACKENDS))
+    args = parser.parse_args()
+    sys.exit(1 if run(args.n, args.workers, args.chunk_size, args.seed, args.backends) else 0)
@@ -0,0 +1,237 @@
+# metrics.py
+"""
+In-process latency histograms and counters for the guardian, with an opt-in exporter
+in the Prometheus text format (a textfile for node_exporter, or a local /metrics endpoint).
+
+Recording is off unless `metrics_enabled` is set in the `verifier` section of the
+configuration (or enable() is called). While it is off, timers and counters are shared
+no-op objects, so instrumented code pays a method call and nothing else.
+"""
+import atexit
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import VERIFIER_SETTINGS
+
+# Latency buckets in seconds, from 10µs (a cached verdict) to 1s (the default Z3 timeout).
+LATENCY_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0)
+
+_enabled = bool(VERIFIER_SETTINGS["metrics_enabled"])
+
+def enable(flag: bool = True):
+    """Turns recording on or off for the whole process."""
+    global _enabled
+    _enabled = flag
+
+def is_enabled() -> bool:
+    return _enabled
+
+class _NullTimer:
+    """Stands in for every timer and stopwatch while recording is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def lap(self, label: str):
+        pass
+
+_NULL_TIMER = _NullTimer()
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+class Stopwatch:
+    """Times consecutive steps of one call: lap(label) records the time since the previous lap."""
+
+    def __init__(self, family):
+        self.family = family
+        self.last = time.perf_counter()
+
+    def lap(self, label: str):
+        now = time.perf_counter()
+        self.family.labels(label).observe(now - self.last)
+        self.last = now
+
+class Histogram:
+    """Observation counts per latency bucket, plus their sum and count."""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot is the +Inf bucket.
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        if not _enabled:
+            return
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def time(self):
+        """A context manager that observes the duration of its block."""
+        return _Timer(self) if _enabled else _NULL_TIMER
+
+    def samples(self) -> list[tuple[str, dict, float]]:
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        samples, cumulative = [], 0
+        for bound, count in zip((*self.buckets, "+Inf"), counts):
+            cumulative += count
+            samples.append(("_bucket", {"le": _format_value(bound) if bound != "+Inf" else bound}, cumulative))
+        return samples + [("_sum", {}, total), ("_count", {}, cumulative)]
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        if not _enabled:
+            return
+        with self._lock:
+            self.value += amount
+
+    def samples(self) -> list[tuple[str, dict, float]]:
+        return [("", {}, self.value)]
+
+class Family:
+    """All series of one metric name, one per combination of label values."""
+
+    def __init__(self, kind: str, name: str, documentation: str, label_names: tuple, factory):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._factory = factory
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"Metric '{self.name}' takes labels {self.label_names}, got {values}.")
+            with self._lock:
+                child = self._children.setdefault(values, self._factory())
+        return child
+
+    def stopwatch(self):
+        """A Stopwatch whose laps are observed under the family's single label."""
+        return Stopwatch(self) if _enabled else _NULL_TIMER
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            labels = dict(zip(self.label_names, values))
+            for suffix, extra, value in child.samples():
+                lines.append(f"{self.name}{suffix}{_format_labels({**labels, **extra})} {_format_value(value)}")
+        return lines
+
+_registry: dict[str, Family] = {}
+_registry_lock = threading.Lock()
+
+def _register(kind: str, name: str, documentation: str, label_names: tuple, factory) -> Family:
+    with _registry_lock:
+        family = _registry.get(name)
+        if family is None:
+            family = _registry[name] = Family(kind, name, documentation, tuple(label_names), factory)
+        elif family.kind != kind or family.label_names != tuple(label_names):
+            raise ValueError(f"Metric '{name}' is already registered as a {family.kind} with labels {family.label_names}.")
+    return family
+
+def histogram(name: str, documentation: str, label_names=(), buckets: tuple = LATENCY_BUCKETS) -> Family:
+    """Registers (or returns the already registered) histogram family `name`."""
+    return _register("histogram", name, documentation, label_names, lambda: Histogram(buckets))
+
+def counter(name: str, documentation: str, label_names=()) -> Family:
+    """Registers (or returns the already registered) counter family `name`."""
+    return _register("counter", name, documentation, label_names, Counter)
+
+def _format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+def render() -> str:
+    """Renders every registered metric in the Prometheus text exposition format."""
+    with _registry_lock:
+        families = sorted(_registry.values(), key=lambda family: family.name)
+    return "".join(line + "\n" for family in families for line in family.render())
+
+# --- Exporters ---
+
+def write_textfile(path: str):
+    """Writes render() to `path` atomically, as node_exporter's textfile collector expects."""
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as f:
+        f.write(render())
+    os.replace(temporary, path)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes are not worth a line on stderr each.
+
+def start_http_server(port: int, address: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serves render() at http://address:port/metrics from a daemon thread."""
+    server = ThreadingHTTPServer((address, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+def _write_textfile_every(path: str, interval: float):
+    while True:
+        time.sleep(interval)
+        write_textfile(path)
+
+_exporters_started = False
+_exporters_lock = threading.Lock()
+
+def start_exporters():
+    """
+    Starts the exporters configured in VERIFIER_SETTINGS (metrics_http_port, metrics_textfile),
+    once per process. Does nothing unless metrics_enabled is set.
+    """
+    global _exporters_started
+    with _exporters_lock:
+        if _exporters_started or not VERIFIER_SETTINGS["metrics_enabled"]:
+            return
+        _exporters_started = True
+        port = VERIFIER_SETTINGS["metrics_http_port"]
+        if port:
+            start_http_server(port, VERIFIER_SETTINGS["metrics_http_address"])
+        path = VERIFIER_SETTINGS["metrics_textfile"]
+        if path:
+            threading.Thread(target=_write_textfile_every, name="metrics-textfile", daemon=True,
+                             args=(path, VERIFIER_SETTINGS["metrics_textfile_interval_seconds"])).start()
+            atexit.register(write_textfile, path)
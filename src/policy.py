@@ -0,0 +1,438 @@
+# policy.py
+"""
+A small declarative rule language for transaction invariants.
+
+Rules live in the `policy` section of security_rules.yaml. Each rule has an `id`,
+a `message` shown when it is the first rule (in file order) that a transfer
+violates, and a `rule` expression built from:
+
+  variables   amount, destination, sender, balance (the sender's balance),
+              window_transfers, window_amount (transfers to the destination in the rolling window)
+  constants   numbers, {param: <transaction_rules key>}, {account: <account ID or param>}
+  arithmetic  {add: [a, b, ...]}, {sub: [a, b]}
+  bounds      {lt|le|gt|ge|eq|ne: [a, b]}
+  logic       {and: [...]}, {or: [...]}, {not: x}, {implies: [if, then]}
+  membership  {in: [x, [a, b, ...]]}
+
+A policy is parsed and validated once, cached by the hash of its source file, and
+compiled into Z3 terms plus scalar and NumPy evaluators, so checking a transfer
+never re-reads or re-interprets the rules. At load time the rules are also analyzed
+with Z3: rules implied by the others are dropped, and contradictions are reported.
+"""
+import hashlib
+import json
+import math
+import operator
+from fractions import Fraction
+from functools import reduce
+from typing import NamedTuple
+
+import numpy as np
+from z3 import And, BoolVal, Context, Distinct, Implies, Int, Not, Or, Real, Solver, unsat
+
+# Variables a rule can refer to. Accounts are compared by their stable integer ID.
+VARIABLES = ("amount", "destination", "sender", "balance", "window_transfers", "window_amount")
+
+# Variables describing account state rather than the transfer itself; callers supply their
+# current values at check time. Real-valued variables make a policy mixed integer/real.
+STATE_VARIABLES = ("balance", "window_transfers", "window_amount")
+REAL_VARIABLES = {"balance", "window_amount"}
+
+ARITHMETIC = {"add": operator.add, "sub": operator.sub}
+
+# Stand-in ID for accounts a rule names but that do not exist, so that the rule fails closed.
+MISSING_ACCOUNT_ID = -1
+
+# Per-query budget of the load-time analyzer; a rule whose redundancy it cannot settle is kept.
+ANALYSIS_TIMEOUT_MS = 2000
+
+COMPARISONS = {
+    "lt": operator.lt, "le": operator.le, "gt": operator.gt,
+    "ge": operator.ge, "eq": operator.eq, "ne": operator.ne,
+}
+
+# The rules enforced when security_rules.yaml has no `policy` section, and the
+# transaction_rules values they fall back to.
+DEFAULT_PARAMS = {"max_amount": 10000, "high_value_threshold": 8000, "high_value_destination_account": "Account_D"}
+DEFAULT_POLICY_RULES = [
+    {
+        "id": "sender_authorized",
+        "rule": {"eq": ["sender", {"account": "USER_ACCOUNT"}]},
+        "message": "Authorization Violation: Transfers can only be initiated from USER_ACCOUNT, not '{sender}'. This is mathematically enforced by the Z3 proof.",
+    },
+    {
+        "id": "high_value_destination",
+        "rule": {"implies": [
+            {"gt": ["amount", {"param": "high_value_threshold"}]},
+            {"eq": ["destination", {"account": {"param": "high_value_destination_account"}}]},
+        ]},
+        "message": "Policy Violation: Transfers over ${high_value_threshold:,} must go to {high_value_destination_account}, not '{destination}'.",
+    },
+    {
+        "id": "amount_positive",
+        "rule": {"gt": ["amount", 0]},
+        "message": "Invalid Amount: Transfer amount must be positive.",
+    },
+    {
+        "id": "amount_within_limit",
+        "rule": {"le": ["amount", {"param": "max_amount"}]},
+        "message": "Limit Exceeded: Amount ${amount:,} exceeds the maximum transaction limit of ${max_amount:,}.",
+    },
+]
+
+class PolicyError(ValueError):
+    """Raised when the policy section of the configuration is malformed."""
+
+class Rule(NamedTuple):
+    id: str
+    expression: tuple
+    message: str
+    variables: frozenset
+
+class PolicyAnalysis(NamedTuple):
+    source_rules: int          # Rules in the configuration.
+    redundant: dict            # Dropped rule ID -> IDs of the enforced rules that imply it.
+    contradiction: list        # IDs of rules that no transfer can satisfy together ([] if none).
+
+    def summary(self) -> str:
+        enforced = self.source_rules - len(self.redundant)
+        text = f"Policy: {enforced} of {self.source_rules} rules enforced"
+        if self.redundant:
+            text += "; dropped " + ", ".join(f"'{rule_id}' (implied by {', '.join(by) or 'nothing: always true'})"
+                                            for rule_id, by in self.redundant.items())
+        if self.contradiction:
+            text += f"; rules {', '.join(self.contradiction)} contradict each other, so every transfer is rejected"
+        return text + "."
+
+class PolicyProgram:
+    """
+    A parsed and validated rule set. Expressions are kept as small tuples
+    (e.g. ("cmp", "gt", ("var", "amount"), ("const", 0))) and compiled on demand
+    into Z3 terms or Python closures for a given account-ID binding.
+    `rules` holds only the rules left after analysis; `analysis` says what was dropped.
+    """
+
+    def __init__(self, fingerprint: str, params: dict, rules: list[Rule], analysis: PolicyAnalysis | None = None):
+        self.fingerprint = fingerprint
+        self.params = dict(params)
+        self.rules = rules
+        self.analysis = analysis or PolicyAnalysis(len(rules), {}, [])
+        self.rule_ids = [rule.id for rule in rules]
+        self.variables = frozenset().union(*(rule.variables for rule in rules))
+        self.referenced_accounts = sorted({name for rule in rules for name in _accounts_in(rule.expression)})
+        self.state_variables = [name for name in STATE_VARIABLES if name in self.variables]
+        # Integer-only rules are linear integer arithmetic; balances and fractional constants add reals.
+        integral = not (REAL_VARIABLES & self.variables) and all(type(c) is int for c in self.constants())
+        self.logic = "QF_LIA" if integral else "QF_LIRA"
+        # Every rule is a sum of its leaves, so scaling all of them by a common factor preserves
+        # every comparison: `denominator` makes the constants integral, `widest_sum` bounds the sums.
+        self.denominator = math.lcm(1, *(exact(c).denominator for c in self.constants()))
+        self.widest_sum = max((_leaf_count(node) for rule in rules for node in _walk(rule.expression)
+                               if node[0] == "arith"), default=1)
+
+    def constants(self) -> list[int]:
+        """Every numeric constant the rules compare against, for boundary-focused testing."""
+        return sorted({value for rule in self.rules for value in _constants_in(rule.expression)})
+
+    def message(self, rule_id: str, **values) -> str:
+        """Renders the message of a rule for a concrete transaction."""
+        for rule in self.rules:
+            if rule.id == rule_id:
+                try:
+                    return rule.message.format_map({**self.params, **values})
+                except (KeyError, IndexError, ValueError, TypeError):
+                    return rule.message
+        return "Verification Failed: Transaction does not satisfy system invariants."
+
+    def z3_invariants(self, variables: dict, account_ids: dict[str, int], ctx) -> list[tuple[str, object]]:
+        """Compiles every rule into a Z3 Boolean term over the given Z3 variables."""
+        return [(rule.id, _to_z3(rule.expression, variables, account_ids, ctx)) for rule in self.rules]
+
+    def scalar_rules(self, account_ids: dict[str, int], rule_ids=None) -> list[tuple[str, object]]:
+        """Compiles rules into closures f(amount, destination, sender, state) -> bool, where state maps STATE_VARIABLES to values."""
+        return [(rule.id, _to_python(rule.expression, account_ids, _SCALAR_OPS))
+                for rule in self.rules if rule_ids is None or rule.id in rule_ids]
+
+    def vector_rules(self, account_ids: dict[str, int], scale: int = 1) -> list[tuple[str, object]]:
+        """
+        Compiles rules into closures over NumPy columns that return a Boolean mask. Constants and
+        account IDs are multiplied by `scale` (a multiple of `denominator`), so the columns must be too.
+        """
+        return [(rule.id, _to_python(rule.expression, account_ids, _VECTOR_OPS, scale)) for rule in self.rules]
+
+_program_cache: dict[str, PolicyProgram] = {}
+
+def load_program(params: dict, rules: list[dict] | None, source_hash: str | None = None) -> PolicyProgram:
+    """
+    Returns the compiled program for a rule set, parsing it only the first time a
+    given source is seen. source_hash identifies the configuration file contents;
+    without it the rules themselves are hashed.
+    """
+    if rules is None:
+        rules, params = DEFAULT_POLICY_RULES, {**DEFAULT_PARAMS, **params}
+    if source_hash is None:
+        source_hash = hashlib.sha256(
+            json.dumps({"params": params, "rules": rules}, sort_keys=True, default=str).encode()).hexdigest()
+    program = _program_cache.get(source_hash)
+    if program is None:
+        rules = _parse_rules(rules, params)
+        enforced, analysis = analyze_rules(rules)
+        if analysis.redundant or analysis.contradiction:
+            print(analysis.summary())
+        program = _program_cache[source_hash] = PolicyProgram(source_hash, params, enforced, analysis)
+    return program
+
+def get_program(fingerprint: str) -> PolicyProgram | None:
+    """Returns the already-loaded program with the given fingerprint, or None if it was never loaded."""
+    return _program_cache.get(fingerprint)
+
+def analyze_rules(rules: list[Rule]) -> tuple[list[Rule], PolicyAnalysis]:
+    """
+    Uses Z3 to find rules that add nothing to the policy and drops them.
+    Rules are examined from last to first and a rule is dropped when the remaining rules
+    imply it, so of two equivalent rules the earlier one is kept and keeps reporting.
+    Accounts are analyzed symbolically (distinct, non-negative IDs), so the result holds for
+    every account set. A policy whose rules contradict each other is left as is and reported.
+    """
+    ctx = Context()
+    variables = {name: (Real if name in REAL_VARIABLES else Int)(name, ctx) for name in VARIABLES}
+    accounts = sorted({name for rule in rules for name in _accounts_in(rule.expression)})
+    account_ids = {name: Int(f"account:{name}", ctx) for name in accounts}
+    background = [account_ids[name] >= 0 for name in accounts] + [variables["window_transfers"] >= 0]
+    if len(accounts) > 1:
+        background.append(Distinct(*account_ids.values()))
+    terms = {rule.id: _to_z3(rule.expression, variables, account_ids, ctx) for rule in rules}
+
+    def unsat_core(assumed: list[str], extra=None) -> list[str] | None:
+        """Returns the assumed rules that make the query unsatisfiable, or None if it is not."""
+        solver = Solver(ctx=ctx)
+        solver.set("timeout", ANALYSIS_TIMEOUT_MS)
+        solver.set("core.minimize", True)
+        solver.add(background)
+        if extra is not None:
+            solver.add(extra)
+        for rule_id in assumed:
+            solver.assert_and_track(terms[rule_id], rule_id)
+        if solver.check() != unsat:
+            return None
+        core = {str(literal) for literal in solver.unsat_core()}
+        return [rule_id for rule_id in assumed if rule_id in core]
+
+    contradiction = unsat_core(list(terms))
+    if contradiction is not None:
+        return rules, PolicyAnalysis(len(rules), {}, contradiction)
+
+    kept = [rule.id for rule in rules]
+    redundant = {}
+    for rule in reversed(rules):
+        others = [rule_id for rule_id in kept if rule_id != rule.id]
+        implied_by = unsat_core(others, Not(terms[rule.id]))
+        if implied_by is not None:
+            kept = others
+            redundant[rule.id] = implied_by
+    redundant = {rule.id: redundant[rule.id] for rule in rules if rule.id in redundant}
+    return [rule for rule in rules if rule.id in kept], PolicyAnalysis(len(rules), redundant, [])
+
+def _parse_rules(rules: list[dict], params: dict) -> list[Rule]:
+    if not isinstance(rules, list) or not rules:
+        raise PolicyError("policy must be a non-empty list of rules")
+    parsed, seen = [], set()
+    for index, entry in enumerate(rules):
+        where = f"policy[{index}]"
+        if not isinstance(entry, dict) or not {"id", "rule"} <= entry.keys():
+            raise PolicyError(f"{where}: each rule needs an 'id' and a 'rule'")
+        rule_id = str(entry["id"])
+        if rule_id in seen:
+            raise PolicyError(f"{where}: duplicate rule id '{rule_id}'")
+        seen.add(rule_id)
+        expression = _parse_bool(entry["rule"], params, f"{where}.rule")
+        message = entry.get("message", f"Policy Violation: Transaction violates rule '{rule_id}'.")
+        parsed.append(Rule(rule_id, expression, message, frozenset(_variables_in(expression))))
+    return parsed
+
+def _single_key(node, where):
+    if not isinstance(node, dict) or len(node) != 1:
+        raise PolicyError(f"{where}: expected a single-key mapping such as {{gt: [amount, 0]}}, got {node!r}")
+    return next(iter(node.items()))
+
+def _operands(args, count, where):
+    if not isinstance(args, list) or (count is not None and len(args) != count):
+        raise PolicyError(f"{where}: expected a list of {count or 'one or more'} operands, got {args!r}")
+    return args
+
+def _parse_bool(node, params, where) -> tuple:
+    op, args = _single_key(node, where)
+    if op in COMPARISONS:
+        left, right = _operands(args, 2, where)
+        return ("cmp", op, _parse_term(left, params, f"{where}.{op}[0]"), _parse_term(right, params, f"{where}.{op}[1]"))
+    if op in ("and", "or"):
+        return (op, tuple(_parse_bool(arg, params, f"{where}.{op}[{i}]") for i, arg in enumerate(_operands(args, None, where))))
+    if op == "not":
+        return ("not", _parse_bool(args, params, f"{where}.not"))
+    if op == "implies":
+        condition, consequence = _operands(args, 2, where)
+        return ("implies", _parse_bool(condition, params, f"{where}.implies[0]"), _parse_bool(consequence, params, f"{where}.implies[1]"))
+    if op == "in":
+        term, members = _operands(args, 2, where)
+        members = tuple(_parse_term(m, params, f"{where}.in[1][{i}]") for i, m in enumerate(_operands(members, None, f"{where}.in[1]")))
+        for i, member in enumerate(members):
+            if member[0] not in ("const", "account"):
+                raise PolicyError(f"{where}.in[1][{i}]: membership lists may only contain constants and accounts")
+        return ("in", _parse_term(term, params, f"{where}.in[0]"), members)
+    raise PolicyError(f"{where}: unknown operator '{op}'")
+
+def _parse_term(node, params, where) -> tuple:
+    if isinstance(node, str):
+        if node not in VARIABLES:
+            raise PolicyError(f"{where}: unknown variable '{node}' (expected one of {', '.join(VARIABLES)})")
+        return ("var", node)
+    if isinstance(node, (int, float)) and not isinstance(node, bool):
+        return ("const", node)
+    op, arg = _single_key(node, where)
+    if op == "param":
+        return ("const", _number(_param(arg, params, where), where))
+    if op == "account":
+        name = _param(arg["param"], params, where) if isinstance(arg, dict) and "param" in arg else arg
+        if not isinstance(name, str):
+            raise PolicyError(f"{where}: account must name an account ID, got {name!r}")
+        return ("account", name)
+    if op in ARITHMETIC:
+        operands = _operands(arg, 2 if op == "sub" else None, where)
+        if len(operands) < 2:
+            raise PolicyError(f"{where}: '{op}' needs at least two operands")
+        return ("arith", op, tuple(_parse_term(term, params, f"{where}.{op}[{i}]") for i, term in enumerate(operands)))
+    raise PolicyError(f"{where}: unknown term '{op}'")
+
+def _param(name, params, where):
+    if name not in params:
+        raise PolicyError(f"{where}: unknown parameter '{name}' (not in transaction_rules)")
+    return params[name]
+
+def exact(value):
+    """Returns a number as the rational Z3 reads it: finite floats by their shortest decimal repr, others as is."""
+    return Fraction(repr(value)) if type(value) is float and math.isfinite(value) else value
+
+def _number(value, where):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise PolicyError(f"{where}: expected a number, got {value!r}")
+    return value
+
+def _walk(expression):
+    yield expression
+    for child in expression[1:]:
+        if isinstance(child, tuple) and child and isinstance(child[0], str):
+            yield from _walk(child)
+        elif isinstance(child, tuple):
+            for item in child:
+                yield from _walk(item)
+
+def _variables_in(expression):
+    return {node[1] for node in _walk(expression) if node[0] == "var"}
+
+def _accounts_in(expression):
+    return {node[1] for node in _walk(expression) if node[0] == "account"}
+
+def _constants_in(expression):
+    return {node[1] for node in _walk(expression) if node[0] == "const"}
+
+def _leaf_count(expression):
+    if expression[0] == "arith":
+        return sum(_leaf_count(term) for term in expression[2])
+    return 1
+
+# --- Z3 target ---
+
+def _to_z3(expression, variables, account_ids, ctx):
+    kind = expression[0]
+    if kind == "var":
+        return variables[expression[1]]
+    if kind == "const":
+        return expression[1]
+    if kind == "account":
+        return account_ids.get(expression[1], MISSING_ACCOUNT_ID)
+    if kind == "arith":
+        return reduce(ARITHMETIC[expression[1]], [_to_z3(term, variables, account_ids, ctx) for term in expression[2]])
+    if kind == "cmp":
+        left = _to_z3(expression[2], variables, account_ids, ctx)
+        right = _to_z3(expression[3], variables, account_ids, ctx)
+        result = COMPARISONS[expression[1]](left, right)
+        return BoolVal(result, ctx) if isinstance(result, bool) else result
+    if kind == "and":
+        return And(*[_to_z3(arg, variables, account_ids, ctx) for arg in expression[1]], ctx)
+    if kind == "or":
+        return Or(*[_to_z3(arg, variables, account_ids, ctx) for arg in expression[1]], ctx)
+    if kind == "not":
+        return Not(_to_z3(expression[1], variables, account_ids, ctx))
+    if kind == "implies":
+        return Implies(_to_z3(expression[1], variables, account_ids, ctx), _to_z3(expression[2], variables, account_ids, ctx))
+    if kind == "in":
+        term = _to_z3(expression[1], variables, account_ids, ctx)
+        return Or(*[term == _to_z3(member, variables, account_ids, ctx) for member in expression[2]], ctx)
+    raise PolicyError(f"cannot compile '{kind}' to Z3")
+
+# --- Python targets (scalar values or NumPy columns) ---
+
+_SCALAR_OPS = {
+    "and": lambda values: all(values),
+    "or": lambda values: any(values),
+    "not": operator.not_,
+    "implies": lambda condition, consequence: (not condition) or consequence,
+    "in": lambda term, members: term in members,
+}
+
+_VECTOR_OPS = {
+    "and": lambda values: reduce(np.logical_and, values),
+    "or": lambda values: reduce(np.logical_or, values),
+    "not": np.logical_not,
+    "implies": lambda condition, consequence: np.logical_or(np.logical_not(condition), consequence),
+    "in": lambda term, members: np.isin(term, list(members)),
+}
+
+_VARIABLE_GETTERS = {
+    "amount": lambda amount, destination, sender, state: amount,
+    "destination": lambda amount, destination, sender, state: destination,
+    "sender": lambda amount, destination, sender, state: sender,
+}
+
+def _to_python(expression, account_ids, ops, scale=None):
+    """
+    Compiles an expression into a Python closure. Without `scale`, numbers are exact rationals
+    (as in Z3); with it, constants are scaled to integers and the inputs must be scaled alike.
+    """
+    kind = expression[0]
+    if kind == "var":
+        name = expression[1]
+        if scale is None and name in STATE_VARIABLES:
+            return lambda amount, destination, sender, state: exact(state[name])
+        return _VARIABLE_GETTERS.get(name) or (lambda amount, destination, sender, state: state[name])
+    if kind == "arith":
+        combine = ARITHMETIC[expression[1]]
+        terms = [_to_python(term, account_ids, ops, scale) for term in expression[2]]
+        return lambda *row: reduce(combine, [term(*row) for term in terms])
+    if kind in ("const", "account"):
+        value = exact(expression[1]) if kind == "const" else account_ids.get(expression[1], MISSING_ACCOUNT_ID)
+        if scale is not None:
+            value = int(value * scale)
+        return lambda *_: value
+    if kind == "cmp":
+        compare = COMPARISONS[expression[1]]
+        left, right = _to_python(expression[2], account_ids, ops, scale), _to_python(expression[3], account_ids, ops, scale)
+        return lambda *row: compare(left(*row), right(*row))
+    if kind in ("and", "or"):
+        combine = ops[kind]
+        args = [_to_python(arg, account_ids, ops, scale) for arg in expression[1]]
+        return lambda *row: combine([arg(*row) for arg in args])
+    if kind == "not":
+        negate, arg = ops["not"], _to_python(expression[1], account_ids, ops, scale)
+        return lambda *row: negate(arg(*row))
+    if kind == "implies":
+        implies = ops["implies"]
+        condition = _to_python(expression[1], account_ids, ops, scale)
+        consequence = _to_python(expression[2], account_ids, ops, scale)
+        return lambda *row: implies(condition(*row), consequence(*row))
+    if kind == "in":
+        contains = ops["in"]
+        term = _to_python(expression[1], account_ids, ops, scale)
+        members = frozenset(_to_python(member, account_ids, ops, scale)() for member in expression[2])
+        return lambda *row: contains(term(*row), members)
+    raise PolicyError(f"cannot compile '{kind}' to Python")
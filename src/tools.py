@@ -2,6 +2,7 @@
 from langchain_core.tools import tool
 from pydantic import BaseModel, Field
 import database as db
+from verifier import max_permissible_amount, velocity_buckets
 
 from config import SECURITY_RULES
 
@@ -17,16 +18,13 @@ def transfer_funds(amount: int, destination: str) -> str:
     This tool should only be called AFTER passing all verification checks.
     """
     sender = "USER_ACCOUNT"  # Hard-coded: transfers can only come from the authenticated user
-    
-    if not db.account_exists(sender) or not db.account_exists(destination):
-        return "Error: Sender or destination account not found."
 
-    sender_balance = db.get_account_balance(sender)
-    destination_balance = db.get_account_balance(destination)
+    # Debit, credit and the destination's velocity count are applied atomically; the debit only
+    # succeeds if the balance covers it.
+    transferred, reason = db.transfer(sender, destination, db.to_cents(amount), velocity_buckets())
+    if not transferred:
+        return f"Error: {reason}"
 
-    db.update_account_balance(sender, sender_balance - amount)
-    db.update_account_balance(destination, destination_balance + amount)
-    
     return f"Success: Transferred ${amount} from {sender} to {destination}."
 
 
@@ -38,10 +36,22 @@ def get_balance(account_id: str) -> str:
     """Checks the balance of a specified account."""
     balance = db.get_account_balance(account_id)
     if balance is not None:
-        return f"The balance of {account_id} is ${balance}."
+        return f"The balance of {account_id} is {db.format_cents(balance)}."
     else:
         return f"Error: Account '{account_id}' not found."
 
+class MaxTransferSchema(BaseModel):
+    destination: str = Field(description="The destination account ID.")
+
+@tool(args_schema=MaxTransferSchema)
+def get_max_transfer_amount(destination: str) -> dict:
+    """
+    Returns the largest amount USER_ACCOUNT can currently transfer to a destination, and what limits it.
+    Use this to answer "how much can I send?" instead of attempting transfers.
+    """
+    max_amount, reason = max_permissible_amount(destination)
+    return {"destination": destination, "max_transfer_amount": max_amount, "limited_by": reason}
+
 @tool
 def list_available_accounts() -> dict:
     """Lists all non-blacklisted accounts that can be transacted with."""
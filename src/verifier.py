@@ -1,103 +1,831 @@
 # verifier.py
-from z3 import Int, Solver, sat, Implies
+import json
+import math
+import queue
+import re
+import threading
+import time
+from contextlib import contextmanager
+from collections import OrderedDict
+from fractions import Fraction
+from functools import lru_cache
+from itertools import islice
+import numpy as np
+from z3 import And, Context, Implies, Int, Not, Optimize, Real, Solver, SolverFor, Then, is_int_value, main_ctx, sat, unknown, unsat
 import database as db
-from config import SECURITY_RULES
+import metrics
+import policy as policy_dsl
+from config import POLICY_RULES, POLICY_SOURCE_HASH, SECURITY_RULES, VERIFIER_SETTINGS, load_solver_tuning
+
+# Latency metrics (see metrics.py); all of them are no-ops unless metrics are enabled.
+_stage_seconds = metrics.histogram(
+    "sentinel_guardian_stage_seconds", "Wall-clock time of each guardian_check transfer stage.", ("stage",))
+_verdicts_total = metrics.counter(
+    "sentinel_guardian_verdicts_total", "guardian_check verdicts by outcome.", ("verdict",))
+_verify_seconds = metrics.histogram(
+    "sentinel_verify_step_seconds", "Wall-clock time of each step of verify_transaction_safety.", ("step",))
+_verdict_cache_total = metrics.counter(
+    "sentinel_verdict_cache_lookups_total", "Verdict cache lookups in verify_transaction_safety by result.", ("result",))
+_compile_seconds = metrics.histogram(
+    "sentinel_policy_compile_seconds", "Wall-clock time of each step of compiling the policy into a Z3 solver.", ("step",))
+_z3_check_seconds = metrics.histogram(
+    "sentinel_z3_check_seconds", "Wall-clock time of each Z3 solver check.").labels()
 
 def get_account_id_map() -> dict[str, int]:
     """
-    Generates a mapping from account ID strings to integer IDs for Z3 solver.
-    Fetches the accounts directly from the database.
+    Generates a mapping from account ID strings to their stable integer IDs for the Z3 solver.
+    Scans the whole accounts table; use db.get_account_num() to resolve a single account.
     """
     accounts = db.get_all_accounts()
-    return {name['id']: i for i, name in enumerate(accounts)}
+    return {acc['id']: acc['account_num'] for acc in accounts}
+
+def _current_program() -> policy_dsl.PolicyProgram:
+    """Returns the compiled rule program for the current configuration (parsed once per source)."""
+    return policy_dsl.load_program(SECURITY_RULES, POLICY_RULES, POLICY_SOURCE_HASH)
+
+PRESCREEN_REJECT, PRESCREEN_UNDECIDED, PRESCREEN_ACCEPT = -1, 0, 1
+# The pre-screen compares int64 columns; sums of its scaled values must stay below this.
+_INT64_LIMIT = 2 ** 63
+
+# Rule ID reported when Z3 runs out of its budget before reaching a verdict, and its reason.
+BUDGET_EXCEEDED = "budget_exceeded"
+BUDGET_EXCEEDED_REASON = "Verification Budget Exceeded: The proof did not complete within its time/resource budget, so the transaction is blocked."
+
+_budget_lock = threading.Lock()
+_budget_stats = {"checks": 0, "budget_exceeded": 0, "timeout": 0, "rlimit": 0, "other": 0}
+
+def _count_check(reason_unknown: str | None = None):
+    with _budget_lock:
+        _budget_stats["checks"] += 1
+        if reason_unknown is not None:
+            _budget_stats["budget_exceeded"] += 1
+            if "timeout" in reason_unknown:
+                _budget_stats["timeout"] += 1
+            elif "resource" in reason_unknown or "canceled" in reason_unknown:
+                # Incremental checks that hit the rlimit may report themselves as "canceled".
+                _budget_stats["rlimit"] += 1
+            else:
+                _budget_stats["other"] += 1
+
+def get_budget_stats() -> dict:
+    """Returns how many Z3 checks ran and how many were blocked for exhausting their budget, and why."""
+    with _budget_lock:
+        stats = dict(_budget_stats)
+    stats["timeout_ms"] = VERIFIER_SETTINGS["check_timeout_ms"]
+    stats["rlimit_budget"] = VERIFIER_SETTINGS["check_rlimit"]
+    return stats
+
+# Label of the admissible segment in the interval table, and the class of accounts no rule names.
+ADMISSIBLE = "admissible"
+OTHER_ACCOUNTS = "other"
 
-def verify_transaction_safety(amount_val: int, destination_val: str, sender_val: str = "USER_ACCOUNT"):
+# Variables the admissible-interval table can be built over; rules using others are evaluated directly.
+_INTERVAL_VARIABLES = {"amount", "destination", "sender"}
+
+def _with_params(solver, **params):
+    for name, value in params.items():
+        solver.set(name, value)
+    return solver
+
+# Solver configurations a policy can be compiled with, as factories of (logic, ctx).
+# Every constraint is quantifier-free linear arithmetic, so the default is a solver
+# specialized for the policy's logic; `python benchmark.py tactics` times all of them
+# on the running policy and records the fastest one that still yields unsat cores.
+SOLVER_CONFIGS = {
+    "generic": lambda logic, ctx: Solver(ctx=ctx),
+    "specialized": lambda logic, ctx: SolverFor(logic, ctx=ctx),
+    "specialized-arith2": lambda logic, ctx: _with_params(SolverFor(logic, ctx=ctx), **{"arith.solver": 2}),
+    "specialized-no-relevancy": lambda logic, ctx: _with_params(SolverFor(logic, ctx=ctx), relevancy=0),
+    "simplify-solve-eqs-smt": lambda logic, ctx: Then("simplify", "solve-eqs", "smt", ctx=ctx).solver(),
+}
+DEFAULT_SOLVER_CONFIG = "specialized"
+
+def solver_config_for(program: policy_dsl.PolicyProgram) -> str:
+    """Returns the solver configuration recorded for a policy, or the default."""
+    name = load_solver_tuning().get(program.fingerprint, DEFAULT_SOLVER_CONFIG)
+    return name if name in SOLVER_CONFIGS else DEFAULT_SOLVER_CONFIG
+
+def _finite_bound(value) -> int | None:
+    """Converts an Optimize bound to an int, or None when the objective is unbounded."""
+    return value.as_long() if is_int_value(value) else None
+
+class CompiledPolicy:
+    """
+    The system invariants (the Constitution) asserted once into a Z3 solver.
+    Each invariant is tracked by its rule ID, and each proposed transaction is
+    answered inside push()/pop(): a single solve yields both the verdict and,
+    on rejection, the unsat core of violated rules.
+    """
+
+    def __init__(self, program: policy_dsl.PolicyProgram, account_id_map: dict[str, int], ctx: Context | None = None,
+                 solver_config: str | None = None, timeout_ms: int | None = None, rlimit: int | None = None):
+        self.program = program
+        self.rule_ids = program.rule_ids
+        # Accounts the rules name but that do not exist get an ID no transaction can carry.
+        self.account_ids = {
+            name: account_id_map.get(name, policy_dsl.MISSING_ACCOUNT_ID) for name in program.referenced_accounts
+        }
+        self.state_variables = program.state_variables
+
+        # All Z3 objects live in one context, which must only be used by one thread at a time.
+        self.ctx = ctx or main_ctx()
+        self.amount = Int('amount', self.ctx)
+        self.destination = Int('destination', self.ctx)
+        self.sender = Int('sender', self.ctx)
+        self.state = {
+            name: (Real if name in policy_dsl.REAL_VARIABLES else Int)(name, self.ctx) for name in policy_dsl.STATE_VARIABLES
+        }
+        self.solver_config = solver_config or solver_config_for(program)
+        self.solver = SOLVER_CONFIGS[self.solver_config](program.logic, self.ctx)
+        self.timeout_ms = VERIFIER_SETTINGS["check_timeout_ms"] if timeout_ms is None else timeout_ms
+        self.rlimit = VERIFIER_SETTINGS["check_rlimit"] if rlimit is None else rlimit
+        self._apply_budget(self.solver)
+        variables = {"amount": self.amount, "destination": self.destination, "sender": self.sender, **self.state}
+        self.invariants = program.z3_invariants(variables, self.account_ids, self.ctx)
+
+        # Each invariant is tracked under the guard that every earlier invariant holds.
+        # The conjunction is unchanged, but a rejected transaction then violates exactly one
+        # tracked constraint, so the unsat core names the first rule it breaks in policy order.
+        self.solver.set("core.minimize", True)
+        higher_priority = []
+        for rule_id, invariant in self.invariants:
+            self.solver.assert_and_track(Implies(And(*higher_priority, self.ctx), invariant), rule_id)
+            higher_priority.append(invariant)
+
+        # Rules over account state (e.g. the balance) cannot be tabulated by amount; decide()
+        # evaluates them directly and reports whichever violation comes first in policy order.
+        rank = {rule_id: i for i, rule_id in enumerate(self.rule_ids)}
+        self._rank = rank.__getitem__
+        self._interval_rule_ids = [rule.id for rule in program.rules if rule.variables <= _INTERVAL_VARIABLES]
+        residual = set(self.rule_ids) - set(self._interval_rule_ids)
+        self._residual_rules = program.scalar_rules(self.account_ids, residual) if residual else []
+        # prescreen() works in int64 units of 1/scale: cents, finer if a constant needs it.
+        self._scale = math.lcm(program.denominator, db.CENTS_PER_DOLLAR)
+        self._scaled_bound = _INT64_LIMIT // program.widest_sum
+        leaves = [*map(policy_dsl.exact, program.constants()), *self.account_ids.values(), policy_dsl.MISSING_ACCOUNT_ID]
+        exact_in_int64 = all(abs(value * self._scale) < self._scaled_bound for value in leaves)
+        self._vector_rules = program.vector_rules(self.account_ids, self._scale) if exact_in_int64 else None
+        self._referenced_ids = set(self.account_ids.values())
+        self._intervals = None
+        self._max_amounts = {}
+        self.key = None  # Set by compile_current_policy() to the program/account-set version compiled.
+
+    def _has_state(self, state: dict | None) -> bool:
+        return not self.state_variables or (state is not None and all(state.get(name) is not None for name in self.state_variables))
+
+    def check(self, amount_val: int, destination_id: int, sender_id: int, state: dict | None = None) -> tuple[bool, list[str]]:
+        """
+        Checks a proposed action against the pre-asserted invariants.
+        `state` gives the current value of each account-state variable the rules use (balance, window_*).
+        Returns the verdict and the IDs of the violated rules named by the unsat core.
+        A check that exhausts its budget fails closed with [BUDGET_EXCEEDED].
+        """
+        if not self._has_state(state):
+            return False, []  # Fail closed: a state rule cannot be proven without the state.
+        # The proposed action is asserted in a scope of its own so that the unsat core can
+        # only ever name tracked invariants, never the transaction's own values.
+        self.solver.push()
+        try:
+            self.solver.add(self.amount == amount_val, self.destination == destination_id, self.sender == sender_id)
+            for name in self.state_variables:
+                self.solver.add(self.state[name] == state[name])
+            with _z3_check_seconds.time():
+                result = self.solver.check()
+            if result == sat:
+                _count_check()
+                return True, []
+            if result != unsat:
+                _count_check(self.solver.reason_unknown())
+                return False, [BUDGET_EXCEEDED]
+            _count_check()
+            core = {str(literal) for literal in self.solver.unsat_core()}
+            return False, [rule_id for rule_id in self.rule_ids if rule_id in core]
+        finally:
+            self.solver.pop()
+
+    def decide(self, amount_val: int, destination_id: int, sender_id: int, state: dict | None = None) -> tuple[bool, list[str]]:
+        """
+        Same contract as check(), answered from the admissible-interval table when the
+        amount is an integer and the account pair's rules reduce to intervals.
+        """
+        if type(amount_val) is int and self._has_state(state):
+            segments = self.admissible_intervals().get((self._account_class(sender_id), self._account_class(destination_id)))
+            if segments is not None:
+                for lo, hi, label in segments:
+                    if (lo is None or lo <= amount_val) and (hi is None or amount_val <= hi):
+                        violations = [] if label == ADMISSIBLE else [label]
+                        for rule_id, holds in self._residual_rules:
+                            if not holds(amount_val, destination_id, sender_id, state):
+                                violations.append(rule_id)
+                                break
+                        violations.sort(key=self._rank)
+                        return (not violations), violations[:1]
+        return self.check(amount_val, destination_id, sender_id, state)
+
+    def max_amount(self, destination_id: int, sender_id: int, state: dict | None = None, ceiling: int | None = None) -> tuple:
+        """
+        Maximizes the amount over all invariants for one destination, sender and account state,
+        among amounts up to `ceiling` if one is given (e.g. what the sender's funds cover).
+        Returns (sat, n, rules) with the largest admissible amount, (sat, None, []) if it is
+        unbounded, (unsat, None, rules) if no amount is admissible, or (unknown, None, []) if the
+        budget ran out; `rules` are those violated by the next amount up (n + 1, or 1 if none).
+        Answers are cached for the lifetime of this compiled policy, i.e. per policy version.
+        """
+        if not self._has_state(state):
+            return unknown, None, []
+        key = (destination_id, sender_id, tuple(state[name] for name in self.state_variables) if state else (), ceiling)
+        answer = self._max_amounts.get(key)
+        if answer is None:
+            opt = Optimize(ctx=self.ctx)
+            self._apply_budget(opt)
+            opt.add([invariant for _, invariant in self.invariants])
+            opt.add(self.destination == destination_id, self.sender == sender_id)
+            opt.add([self.state[name] == state[name] for name in self.state_variables])
+            if ceiling is not None:
+                opt.add(self.amount <= ceiling)
+            highest = opt.maximize(self.amount)
+            result = opt.check()
+            bound = _finite_bound(highest.value()) if result == sat else None
+            limiting_rules = []
+            if result == unsat or bound is not None:
+                probe = 1 if result == unsat else bound + 1
+                _, limiting_rules = self.check(probe, destination_id, sender_id, state)
+            answer = (result, bound, limiting_rules)
+            if result != unknown:
+                if len(self._max_amounts) >= 4096:
+                    self._max_amounts.clear()
+                self._max_amounts[key] = answer
+        return answer
+
+    def admissible_intervals(self) -> dict[tuple, list[tuple] | None]:
+        """
+        Precomputes, once per compiled policy, which amounts each (sender, destination) class may
+        carry. Accounts the rules name are classes of their own; every other account behaves
+        identically and shares the OTHER_ACCOUNTS class. For each class, the amount line is split
+        into [lo, hi] segments (None = unbounded) labelled ADMISSIBLE or with the rule a rejection
+        would report. Classes whose segments are not intervals map to None and stay with Z3.
+        """
+        if self._intervals is None:
+            classes = list(self._referenced_ids) + [OTHER_ACCOUNTS]
+            self._intervals = {
+                (sender_class, destination_class): self._segments_for(sender_class, destination_class)
+                for sender_class in classes for destination_class in classes
+            }
+        return self._intervals
+
+    def _apply_budget(self, solver):
+        """Bounds every solve of a solver by the policy's time and resource budgets."""
+        if self.timeout_ms:
+            solver.set("timeout", self.timeout_ms)
+        if self.rlimit:
+            solver.set("rlimit", self.rlimit)
+
+    def _account_class(self, account_id: int):
+        return account_id if account_id in self._referenced_ids else OTHER_ACCOUNTS
+
+    def _class_constraint(self, variable, account_class):
+        if account_class == OTHER_ACCOUNTS:
+            return And(*[variable != num for num in self._referenced_ids], self.ctx)
+        return variable == account_class
+
+    def _segments_for(self, sender_class, destination_class) -> list[tuple] | None:
+        """Uses Z3 Optimize to find the amount interval behind each possible verdict of one class."""
+        scope = [self._class_constraint(self.sender, sender_class), self._class_constraint(self.destination, destination_class)]
+        # A transaction is rejected for the first invariant it violates, in policy order.
+        labelled = []
+        higher_priority = []
+        for rule_id, invariant in self.invariants:
+            if rule_id not in self._interval_rule_ids:
+                continue
+            labelled.append((rule_id, And(*higher_priority, Not(invariant), self.ctx)))
+            higher_priority.append(invariant)
+        labelled.append((ADMISSIBLE, And(*higher_priority, self.ctx)))
+
+        segments = []
+        for label, condition in labelled:
+            opt = Optimize(ctx=self.ctx)
+            opt.set(priority='box')
+            self._apply_budget(opt)
+            opt.add(scope + [condition])
+            lowest, highest = opt.minimize(self.amount), opt.maximize(self.amount)
+            if opt.check() != sat:
+                continue  # No amount gets this verdict for this class (or the budget ran out; Z3 decides then).
+            lo, hi = _finite_bound(lowest.value()), _finite_bound(highest.value())
+
+            # The segment is only usable if every amount between its bounds gets this verdict.
+            gap = Solver(ctx=self.ctx)
+            self._apply_budget(gap)
+            gap.add(scope + [Not(condition)])
+            if lo is not None: gap.add(self.amount >= lo)
+            if hi is not None: gap.add(self.amount <= hi)
+            if gap.check() != unsat:
+                return None
+            segments.append((lo, hi, label))
+        return sorted(segments, key=lambda segment: -float("inf") if segment[0] is None else segment[0])
+
+    def _scaled_column(self, values, decidable: np.ndarray, integers_only: bool = False) -> np.ndarray:
+        """
+        Returns values * scale as an int64 column. Rows whose value is missing, not a whole
+        number of 1/scale units or out of range are cleared in `decidable` (and hold 0).
+        """
+        scale, bound = self._scale, self._scaled_bound
+        column = []
+        for row, value in enumerate(values):
+            kind = type(value)
+            if kind is float:
+                value = policy_dsl.exact(value)
+                kind = type(value)
+            if kind is int:
+                scaled = value * scale
+            elif kind is Fraction and not integers_only and scale % value.denominator == 0:
+                scaled = value.numerator * (scale // value.denominator)
+            else:
+                scaled = bound
+            if -bound < scaled < bound:
+                column.append(scaled)
+            else:
+                column.append(0)
+                decidable[row] = False
+        return np.array(column, dtype=np.int64)
+
+    def prescreen(self, amounts, destination_ids, sender_ids, state=None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Evaluates the invariants as array operations over columns of a batch.
+        `state` maps each account-state variable the rules use to a column of values.
+        Returns a status per row and a (rows x rule_ids) matrix of violated rules.
+        The status is PRESCREEN_ACCEPT or PRESCREEN_REJECT for rows it can decide exactly and
+        PRESCREEN_UNDECIDED for rows that still need the Z3 proof (e.g. amounts that are not
+        plain integers, or values that int64 columns cannot hold exactly).
+        """
+        rows = len(amounts)
+        decidable = np.full(rows, self._vector_rules is not None)
+        amount = self._scaled_column(amounts, decidable, integers_only=True)
+        destination = self._scaled_column(destination_ids, decidable, integers_only=True)
+        sender = self._scaled_column(sender_ids, decidable, integers_only=True)
+        columns = {}
+        for name in self.state_variables:
+            # Missing values leave the row to check(), which fails it closed.
+            columns[name] = self._scaled_column((state or {}).get(name) or [None] * rows, decidable)
+
+        violated = np.zeros((rows, len(self.rule_ids)), dtype=bool)
+        for column, (_, holds) in enumerate(self._vector_rules or []):
+            violated[:, column] = np.logical_not(holds(amount, destination, sender, columns))
+
+        safe = ~violated.any(axis=1)
+        statuses = np.where(decidable, np.where(safe, PRESCREEN_ACCEPT, PRESCREEN_REJECT), PRESCREEN_UNDECIDED)
+        return statuses, violated
+
+def _referenced_account_ids(program: policy_dsl.PolicyProgram) -> dict[str, int]:
+    """Maps each account the rules name to its ID, leaving out accounts that do not exist."""
+    account_id_map = {}
+    for name in program.referenced_accounts:
+        num = db.get_account_num(name)
+        if num is not None:
+            account_id_map[name] = num
+    return account_id_map
+
+def compile_current_policy(ctx: Context | None = None, accounts_version: int | None = None) -> CompiledPolicy:
+    """
+    Compiles the current rule program against the current account set, tagging the result with its key.
+    `accounts_version` is the account-set version if the caller has already read it.
+    """
+    stopwatch = _compile_seconds.stopwatch()
+    program = _current_program()
+    key = (program.fingerprint, db.get_accounts_version() if accounts_version is None else accounts_version)
+    account_id_map = _referenced_account_ids(program)
+    stopwatch.lap("account_map")
+    policy = CompiledPolicy(program, account_id_map, ctx)
+    stopwatch.lap("solver")
+    policy.key = key
+    return policy
+
+class PolicyPool:
+    """
+    A bounded pool of compiled policies, each built in its own z3.Context.
+    A Z3 context may only be used by one thread at a time, so every guardian check
+    leases a policy for its duration; concurrent checks from a ThreadPoolExecutor
+    each get their own context and solver instead of serializing on one.
+    Leased policies are rebuilt only when the rules or account set have changed.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self.created = 0
+
+    @contextmanager
+    def lease(self, accounts_version: int | None = None):
+        """
+        Yields a compiled policy for the current rules, blocking while all contexts are in use.
+        `accounts_version` is the account-set version if the caller has already read it.
+        """
+        if accounts_version is None:
+            accounts_version = db.get_accounts_version()
+        key = (_current_program().fingerprint, accounts_version)
+        try:
+            policy = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self.created < self.size
+                if can_create:
+                    self.created += 1
+            policy = None if can_create else self._idle.get()
+
+        try:
+            if policy is None or policy.key != key:
+                policy = compile_current_policy(policy.ctx if policy is not None else Context(), accounts_version)
+        except BaseException:
+            with self._lock:
+                self.created -= 1  # Give the slot back so a later lease can build a fresh policy.
+            raise
+        try:
+            yield policy
+        finally:
+            self._idle.put(policy)
+
+_policy_pool = PolicyPool(VERIFIER_SETTINGS["context_pool_size"])
+
+def policy_version(snapshot: dict | None = None) -> tuple:
+    """
+    Identifies the current policy: the rule set plus the account-set and blacklist versions,
+    taken from a db.get_transfer_snapshot() result when one is passed in.
+    """
+    if snapshot is not None:
+        return (_current_program().fingerprint, snapshot["accounts_version"], snapshot["blacklist_version"])
+    return (_current_program().fingerprint, db.get_accounts_version(), db.get_blacklist_version())
+
+class VerdictCache:
+    """
+    A bounded LRU cache of verification verdicts, tagged with the policy version
+    they were computed under. Every entry is dropped as soon as the version changes.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def get(self, version: tuple, key: tuple):
+        """Returns the cached verdict for key, or None on a miss."""
+        with self._lock:
+            if version != self._version:
+                self._reset(version)
+            verdict = self._entries.get(key)
+            if verdict is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return verdict
+
+    def put(self, version: tuple, key: tuple, verdict: tuple):
+        """Stores a verdict computed under version, evicting the least recently used entry if full."""
+        with self._lock:
+            if version != self._version:
+                self._reset(version)
+            self._entries[key] = verdict
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _reset(self, version: tuple):
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+        self._version = version
+
+    def stats(self) -> dict:
+        """Returns the cache size and its hit/miss/eviction/invalidation counters."""
+        with self._lock:
+            return {
+                "size": len(self._entries), "maxsize": self.maxsize, "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions, "invalidations": self.invalidations,
+            }
+
+_verdict_cache = VerdictCache()
+
+def get_verdict_cache_stats() -> dict:
+    """Returns the counters of the verdict cache used by verify_transaction_safety."""
+    return _verdict_cache.stats()
+
+def get_policy_analysis() -> policy_dsl.PolicyAnalysis:
+    """Returns the load-time analysis of the current policy: rule counts, dropped rules, contradictions."""
+    return _current_program().analysis
+
+# Where each account-state variable of the rules comes from in a db.get_transfer_snapshot() result.
+_SNAPSHOT_FIELDS = {"balance": "sender_balance", "window_transfers": "window_transfers", "window_amount": "window_amount"}
+# Money variables: stored as integer cents, while rules (like transfer amounts) are written in dollars.
+_CENT_VARIABLES = {"balance", "window_amount"}
+
+def _policy_state(snapshot: dict, state_variables) -> dict:
+    """Reads the rules' account-state variables from a snapshot, converting money from cents to exact dollars."""
+    state = {}
+    for name in state_variables:
+        value = snapshot[_SNAPSHOT_FIELDS[name]]
+        state[name] = Fraction(value, db.CENTS_PER_DOLLAR) if name in _CENT_VARIABLES and value is not None else value
+    return state
+
+def velocity_window_start(now: float | None = None) -> int:
+    """
+    Returns the first time bucket of the rolling velocity window. The window is rounded
+    up to whole buckets, so it always covers at least `velocity_window_seconds`.
+    """
+    bucket_seconds = VERIFIER_SETTINGS["velocity_bucket_seconds"]
+    current = int((time.time() if now is None else now) // bucket_seconds)
+    return current - -(-VERIFIER_SETTINGS["velocity_window_seconds"] // bucket_seconds)
+
+def velocity_buckets(now: float | None = None) -> tuple[int, int]:
+    """
+    Returns (bucket, window_start) for a transfer executed at `now`: the velocity bucket it counts
+    towards and the start of its window. db.transfer() records it in the transfer's own transaction.
+    """
+    now = time.time() if now is None else now
+    return int(now // VERIFIER_SETTINGS["velocity_bucket_seconds"]), velocity_window_start(now)
+
+def _window_fields(window: tuple | None) -> dict:
+    transfers, amount = window or (0, 0)
+    return {"window_transfers": transfers, "window_amount": amount}
+
+def verify_transaction_safety(amount_val: int, destination_val: str, sender_val: str = "USER_ACCOUNT", snapshot: dict | None = None):
     """
     Uses Z3 to formally verify if a transaction meets all system invariants.
     This function mathematically proves that the sender is USER_ACCOUNT and all other rules are satisfied.
+    Verdicts are memoized per policy version, so resubmitted transactions skip the solver.
+    Account state and the policy version are taken from a db.get_transfer_snapshot() result
+    when one is passed in.
     """
-    ACCOUNT_ID_MAP = get_account_id_map()
+    stopwatch = _verify_seconds.stopwatch()
+    # Rules over account state (balance, velocity windows) make it part of the verdict, so it is part of the key too.
+    state = None
+    state_variables = _current_program().state_variables
+    if state_variables:
+        if snapshot is None:
+            snapshot = db.get_transfer_snapshot(destination_val, sender_val, velocity_window_start())
+            stopwatch.lap("snapshot")
+        state = _policy_state(snapshot, state_variables)
+    version = policy_version(snapshot)
+    stopwatch.lap("version")
+    # The amount's type is part of the key so that e.g. True and 1 are never conflated.
+    key = (type(amount_val), amount_val, destination_val, sender_val, tuple(state.values()) if state else None)
+    try:
+        verdict = _verdict_cache.get(version, key)
+    except TypeError:  # Unhashable arguments are verified without caching.
+        key = verdict = None
+    stopwatch.lap("cache")
+    if verdict is not None:
+        _verdict_cache_total.labels("hit").inc()
+        return verdict
+    _verdict_cache_total.labels("miss").inc()
+
+    if snapshot is not None:
+        destination_id, sender_id = snapshot["destination_num"], snapshot["sender_num"]
+    else:
+        destination_id, sender_id = db.get_account_num(destination_val), db.get_account_num(sender_val)
+        stopwatch.lap("account_lookup")
+    with _policy_pool.lease(version[1]) as policy:
+        stopwatch.lap("lease")  # Includes recompiling the policy after a rule or account change.
+        verdict = _verify_against_policy(amount_val, destination_val, sender_val, destination_id, sender_id, policy, state)
+        stopwatch.lap("decide")
+    # Budget exhaustion is not a property of the transaction, so it is never memoized.
+    if key is not None and verdict[1] != BUDGET_EXCEEDED_REASON:
+        _verdict_cache.put(version, key, verdict)
+    return verdict
+
+def _verify_against_policy(amount_val: int, destination_val: str, sender_val: str, destination_id: int | None, sender_id: int | None, policy: CompiledPolicy, state: dict | None = None):
+    """Runs the Z3 proof for one transaction against already-resolved account IDs and policy."""
     # Pre-check: Ensure accounts exist before attempting proof
-    if destination_val not in ACCOUNT_ID_MAP:
+    if destination_id is None:
         return False, f"Invalid Destination: Account '{destination_val}' does not exist in the system."
-    if sender_val not in ACCOUNT_ID_MAP:
+    if sender_id is None:
         return False, f"Invalid Sender: Account '{sender_val}' does not exist in the system."
-    
-    amount = Int('amount')
-    destination = Int('destination')
-    sender = Int('sender')
-    s = Solver()
-    
-    # --- Invariants (The Constitution) ---
-    limit = SECURITY_RULES.get("max_amount", 10000)
-    high_value_threshold = SECURITY_RULES.get("high_value_threshold", 8000)
-    high_value_dest_acct_name = SECURITY_RULES.get("high_value_destination_account", "Account_D")
-    
-    user_account_id = ACCOUNT_ID_MAP["USER_ACCOUNT"]
-    
-    # 0. **CRITICAL SECURITY INVARIANT:** Sender MUST be USER_ACCOUNT (mathematically enforced)
-    s.add(sender == user_account_id)
-    
-    # 1. Amount must be positive and within the overall transaction limit.
-    s.add(amount > 0)
-    s.add(amount <= limit)
-
-    # 2. **Complex Rule:** If the amount is over the high-value threshold, it MUST go to the designated high-value account.
-    if high_value_dest_acct_name in ACCOUNT_ID_MAP:
-        high_value_acct_id = ACCOUNT_ID_MAP[high_value_dest_acct_name]
-        s.add(Implies(amount > high_value_threshold, destination == high_value_acct_id))
-
-    # --- Proposed Action (The "Attack") ---
-    s.add(amount == amount_val)
-    s.add(destination == ACCOUNT_ID_MAP[destination_val])
-    s.add(sender == ACCOUNT_ID_MAP[sender_val])
 
     # --- Verification ---
-    if s.check() == sat:
+    is_safe, violated_rules = policy.decide(amount_val, destination_id, sender_id, state)
+    if is_safe:
         return True, "Verified Safe: Transaction parameters conform to all symbolic invariants."
-    else:
-        # More detailed error checking for the user
-        if sender_val != "USER_ACCOUNT":
-            return False, f"Authorization Violation: Transfers can only be initiated from USER_ACCOUNT, not '{sender_val}'. This is mathematically enforced by the Z3 proof."
-        if amount_val > high_value_threshold and destination_val != high_value_dest_acct_name:
-            return False, f"Policy Violation: Transfers over ${high_value_threshold:,} must go to {high_value_dest_acct_name}, not '{destination_val}'."
-        if amount_val <= 0:
-            return False, "Invalid Amount: Transfer amount must be positive."
-        if amount_val > limit:
-            return False, f"Limit Exceeded: Amount ${amount_val:,} exceeds the maximum transaction limit of ${limit:,}."
-        return False, "Verification Failed: Transaction does not satisfy system invariants."
+    return False, _violation_reason(violated_rules, amount_val, destination_val, sender_val, policy, state)
 
+def _violation_reason(violated_rules: list[str], amount_val: int, destination_val: str, sender_val: str, policy: CompiledPolicy, state: dict | None = None) -> str:
+    """Renders the message of the violated rule shown to the user."""
+    rule_id = violated_rules[0] if violated_rules else None
+    if rule_id == BUDGET_EXCEEDED:
+        return BUDGET_EXCEEDED_REASON
+    # Exact dollar amounts are shown as decimals rather than as fractions.
+    values = {name: float(value) if type(value) is Fraction else value for name, value in (state or {}).items()}
+    return policy.program.message(rule_id, amount=amount_val, destination=destination_val, sender=sender_val, **values)
 
-def is_destination_blacklisted(destination: str):
+
+def max_permissible_amount(destination_val: str, sender_val: str = "USER_ACCOUNT") -> tuple[int, str]:
+    """
+    Returns the largest whole amount the sender may transfer to the destination right now and
+    what limits it: the policy invariants together with the sender's balance, maximized with
+    Z3 Optimize once per policy version and account state. The returned amount passes
+    guardian_check; 0 means no transfer is possible, and the reason says why.
+    """
+    snapshot = db.get_transfer_snapshot(destination_val, sender_val, velocity_window_start())
+    is_blacklisted, reason = is_destination_blacklisted(destination_val, snapshot)
+    if is_blacklisted:
+        return 0, reason
+    if snapshot["sender_num"] is None:
+        return 0, f"Invalid Sender: Account '{sender_val}' does not exist in the system."
+    destination_id, sender_id = snapshot["destination_num"], snapshot["sender_num"]
+
+    # The funds are a bound of the same query, so the maximum also satisfies every other rule
+    # (e.g. a minimum amount) rather than being whatever the balance covers.
+    balance = snapshot["sender_balance"]
+    funds_max = balance // db.CENTS_PER_DOLLAR
+    with _policy_pool.lease(snapshot["accounts_version"]) as policy:
+        state = _policy_state(snapshot, policy.state_variables)
+        result, best, limiting_rules = policy.max_amount(destination_id, sender_id, state, ceiling=funds_max)
+        if result == unknown:
+            return 0, BUDGET_EXCEEDED_REASON
+        # Why a larger (or, if none is admissible, any positive) amount would be rejected.
+        probe = 1 if result == unsat else best + 1
+        policy_reason = _violation_reason(limiting_rules, probe, destination_val, sender_val, policy, state)
+
+    balance_reason = f"Limited by the balance of {sender_val}: {db.format_cents(balance)}."
+    if result == unsat or best < 1:
+        return 0, balance_reason if funds_max < 1 else policy_reason
+    if best == funds_max:
+        return best, balance_reason
+    return best, f"Limited by policy. A larger amount is rejected with: {policy_reason}"
+
+def is_destination_blacklisted(destination: str, snapshot: dict | None = None):
     """
     Checks if the destination account is valid and not blacklisted.
     """
-    if not db.account_exists(destination):
-        all_accounts = [acc['id'] for acc in db.get_all_accounts()]
-        return True, f"Invalid Account: Destination '{destination}' does not exist. Available accounts: {', '.join(all_accounts)}."
-    if db.is_account_blacklisted(destination):
+    if snapshot is None:
+        snapshot = db.get_transfer_snapshot(destination)
+    if snapshot["destination_num"] is None:
+        return True, f"Invalid Account: Destination '{destination}' does not exist. Available accounts: {snapshot['available_accounts']}."
+    if snapshot["destination_blacklisted"]:
         return True, f"Blocked Account: Destination '{destination}' is on the security blacklist and cannot receive transfers."
     return False, "Destination OK."
 
-def has_sufficient_funds(sender: str, amount: int):
+def has_sufficient_funds(sender: str, amount: int, snapshot: dict | None = None):
     """
     Checks if the sender has enough funds for the transaction.
+    The balance is in cents and compared exactly against the amount converted to cents.
     """
-    balance = db.get_account_balance(sender)
-    if balance is not None and balance >= amount:
+    balance = snapshot["sender_balance"] if snapshot is not None else db.get_account_balance(sender)
+    if balance is not None and balance >= db.to_cents(amount):
         return True, "Sufficient funds confirmed."
     else:
-        return False, f"Heuristic Violation: Insufficient funds. Sender '{sender}' has ${balance}, but tried to send ${amount}."
+        return False, _insufficient_funds_reason(sender, balance, amount)
+
+def _insufficient_funds_reason(sender: str, balance: int | None, amount) -> str:
+    shown = db.format_cents(balance) if balance is not None else "no balance"
+    return f"Heuristic Violation: Insufficient funds. Sender '{sender}' has {shown}, but tried to send ${amount}."
+
+class StageStats:
+    """Running call count, rejection rate and exponentially weighted mean cost of one guardian_check stage."""
+
+    def __init__(self, alpha: float = 0.05):
+        self.alpha = alpha
+        self.calls = self.rejections = 0
+        self.cost = None  # EWMA of the stage's wall-clock time, in seconds
+        self._lock = threading.Lock()
+
+    def record(self, elapsed: float, rejected: bool):
+        with self._lock:
+            self.calls += 1
+            self.rejections += rejected
+            self.cost = elapsed if self.cost is None else self.cost + self.alpha * (elapsed - self.cost)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls, "rejections": self.rejections,
+                "rejection_rate": self.rejections / self.calls if self.calls else 0.0,
+                "cost_us": (self.cost or 0.0) * 1e6,
+            }
 
-def guardian_check(tool_call):
+# The stages of a transfer check, in the order their rejections take precedence. A verdict
+# reports the first stage in this order that rejects, so every stage up to that one has to
+# run whatever the order of execution; running them in this order is therefore never slower.
+TRANSFER_STAGES = ["destination", "policy", "funds"]
+_stage_stats = {stage: StageStats() for stage in TRANSFER_STAGES}
+
+def _timed_stage(stage: str, rejected_when: bool, check, *args):
+    """Runs one stage's check, recording its cost and whether it rejected (result[0] == rejected_when)."""
+    start = time.perf_counter()
+    result = check(*args)
+    elapsed = time.perf_counter() - start
+    _stage_stats[stage].record(elapsed, result[0] == rejected_when)
+    _stage_seconds.labels(stage).observe(elapsed)
+    return result
+
+def _check_destination(destination: str, sender: str):
+    """Fetches the transfer snapshot in one round trip and runs the destination check on it."""
+    snapshot = db.get_transfer_snapshot(destination, sender, velocity_window_start())
+    return (*is_destination_blacklisted(destination, snapshot), snapshot)
+
+def get_stage_stats() -> dict:
+    """
+    Returns per-stage statistics of guardian_check transfer checks, plus the expected cost of a
+    verdict: each stage's cost weighted by the probability that every earlier stage passed.
+    """
+    stages = {stage: _stage_stats[stage].snapshot() for stage in TRANSFER_STAGES}
+    expected, reach = 0.0, 1.0
+    for stage in TRANSFER_STAGES:
+        expected += reach * stages[stage]["cost_us"]
+        reach *= 1.0 - stages[stage]["rejection_rate"]
+    return {"order": list(TRANSFER_STAGES), "stages": stages, "expected_cost_us": expected}
+
+# --- Proof certificates ---
+# guardian_check() only records a small handle per transfer; the SMT-LIB certificate is
+# rebuilt from it on demand, so verdicts that are never inspected cost nothing extra.
+
+def proof_handle(amount_val, snapshot: dict) -> dict | None:
+    """
+    Returns a compact, JSON-serializable handle identifying the proof behind a transfer's
+    policy verdict: the policy version, the enforced rule IDs, the IDs of the accounts the
+    rules name, and the values of every variable. None when an account does not exist.
+    """
+    if snapshot["destination_num"] is None or snapshot["sender_num"] is None:
+        return None
+    program = _current_program()
+    values = {"amount": amount_val, "destination": snapshot["destination_num"], "sender": snapshot["sender_num"]}
+    values.update(_policy_state(snapshot, program.state_variables))
+    return {
+        "policy": list(policy_version(snapshot)),
+        "rules": list(program.rule_ids),
+        "accounts": _referenced_account_ids(program),
+        "values": values,
+    }
+
+def render_proof(handle: dict) -> dict:
+    """
+    Regenerates the certificate of a proof handle: the SMT-LIB script asserted for the
+    transfer, and the solver's answer with its model (sat) or unsat core (unsat).
+    Rendered certificates are memoized, so re-expanding an entry does not re-solve it.
+    """
+    return _render_proof(json.dumps(handle, sort_keys=True))
+
+def _smt_symbol(name: str) -> str:
+    return name if re.fullmatch(r"[A-Za-z_][A-Za-z0-9_.\-]*", name) else f"|{name}|"
+
+@lru_cache(maxsize=256)
+def _render_proof(handle_json: str) -> dict:
+    handle = json.loads(handle_json)
+    fingerprint, accounts_version, blacklist_version = handle["policy"]
+    program = policy_dsl.get_program(fingerprint)
+    if program is None:
+        return {"result": None, "smtlib": f"; Policy {fingerprint[:12]} is no longer loaded, so its proof cannot be regenerated."}
+
+    # A private context, so rendering never contends with the verification pool.
+    policy = CompiledPolicy(program, handle["accounts"], Context())
+    values = handle["values"]
+    variables = {"amount": policy.amount, "destination": policy.destination, "sender": policy.sender,
+                 **{name: policy.state[name] for name in program.state_variables}}
+    state = {name: values.get(name) for name in program.state_variables}
+    is_safe, core = policy.check(values["amount"], values["destination"], values["sender"], state)
+
+    lines = [f"; Policy {fingerprint[:12]} (accounts v{accounts_version}, blacklist v{blacklist_version})"]
+    lines += [f"; {name} = {num}" for name, num in sorted(policy.account_ids.items())]
+    lines += [f"(set-logic {program.logic})", "(set-option :produce-unsat-cores true)"]
+    lines += [f"(declare-const {variable} {variable.sort()})" for variable in variables.values()]
+    # The invariants exactly as CompiledPolicy tracks them: each guarded by every earlier one.
+    higher_priority = []
+    for rule_id, invariant in policy.invariants:
+        term = Implies(And(*higher_priority, policy.ctx), invariant) if higher_priority else invariant
+        lines.append(f"(assert (! {term.sexpr()} :named {_smt_symbol(rule_id)}))")
+        higher_priority.append(invariant)
+    lines.append("; Proposed transaction")
+    lines += [f"(assert {(variable == values[name]).sexpr()})"
+              for name, variable in variables.items() if values.get(name) is not None]
+    lines.append("(check-sat)")
+
+    if is_safe:
+        lines.append("(get-model)")
+        return {"result": "sat", "smtlib": "\n".join(lines), "model": {name: values.get(name) for name in variables}}
+    if core and core != [BUDGET_EXCEEDED]:
+        lines.append("(get-unsat-core)")
+        return {"result": "unsat", "smtlib": "\n".join(lines), "core": core}
+    return {"result": "unknown", "smtlib": "\n".join(lines)}
+
+# Safe, read-only tools that don't need verification.
+READ_ONLY_TOOLS = ["get_balance", "list_available_accounts", "get_transaction_rules", "get_max_transfer_amount"]
+
+def guardian_check(tool_call, with_proof: bool = False):
     """
     Main verification function that runs all checks based on the tool being called.
+    With with_proof=True a third element is returned: the proof handle of a transfer
+    that reached the policy stage (see proof_handle()), otherwise None.
     """
+    def verdict(is_safe, reason, proof=None):
+        _verdicts_total.labels("approved" if is_safe else "blocked").inc()
+        return (is_safe, reason, proof) if with_proof else (is_safe, reason)
+
     tool_name = tool_call.get('name')
 
     # Whitelist safe, read-only tools that don't need verification.
-    if tool_name in ["get_balance", "list_available_accounts", "get_transaction_rules"]:
-        return True, f"Tool '{tool_name}' is approved as a safe read-only operation."
+    if tool_name in READ_ONLY_TOOLS:
+        return verdict(True, f"Tool '{tool_name}' is approved as a safe read-only operation.")
 
     if tool_name == 'transfer_funds':
         args = tool_call['args']
@@ -105,20 +833,101 @@ def guardian_check(tool_call):
         destination = args.get('destination')
         sender = "USER_ACCOUNT"  # Hard-coded: all transfers must come from the authenticated user
 
-        # 1. Pre-check: Verify destination account exists (before attempting proof)
-        is_blacklisted, reason = is_destination_blacklisted(destination)
-        if is_blacklisted: return False, reason
+        # 1. Pre-check: Verify destination account exists (before attempting proof).
+        #    A single query fetches the destination, blacklist and sender state used by every stage.
+        is_blacklisted, reason, snapshot = _timed_stage("destination", True, _check_destination, destination, sender)
+        if is_blacklisted: return verdict(False, reason)
+        proof = proof_handle(amount, snapshot) if with_proof else None
 
         # 2. Symbolic Check (Z3) for complex logical invariants including sender authorization
         #    This mathematically proves that sender == USER_ACCOUNT
-        is_safe, reason = verify_transaction_safety(amount, destination, sender)
-        if not is_safe: return False, reason
+        is_safe, reason = _timed_stage("policy", False, verify_transaction_safety, amount, destination, sender, snapshot)
+        if not is_safe: return verdict(False, reason, proof)
         
         # 3. Heuristic Check for sufficient funds
-        has_funds, reason = has_sufficient_funds(sender, amount)
-        if not has_funds: return False, reason
+        has_funds, reason = _timed_stage("funds", False, has_sufficient_funds, sender, amount, snapshot)
+        if not has_funds: return verdict(False, reason, proof)
 
-        return True, "All transaction checks passed. Action is approved."
+        return verdict(True, "All transaction checks passed. Action is approved.", proof)
     
     # By default, deny any tool that isn't explicitly handled.
-    return False, f"Tool '{tool_name}' is not recognized or not permitted."
+    return verdict(False, f"Tool '{tool_name}' is not recognized or not permitted.")
+
+def verify_transactions_batch(tool_calls, chunk_size: int = 8192) -> list[tuple[bool, str]]:
+    """
+    Runs guardian_check over a list or iterator of tool calls in one pass.
+    The whole batch shares one account lookup, one blacklist lookup and one compiled
+    policy. Transfers are pre-screened in vectorized chunks and only rows the
+    pre-screen cannot decide are sent to Z3. Verdicts are returned in submission
+    order with the same reason strings as guardian_check.
+    """
+    accounts = db.get_all_accounts()
+    account_id_map = {acc['id']: acc['account_num'] for acc in accounts}
+    balances = {acc['id']: acc['balance'] for acc in accounts}
+    blacklist = set(db.get_all_blacklisted_accounts())
+    windows = db.get_velocity_windows(velocity_window_start())
+
+    verdicts = []
+    tool_calls = iter(tool_calls)
+    with _policy_pool.lease() as policy:
+        while chunk := list(islice(tool_calls, chunk_size)):
+            verdicts.extend(_verify_chunk(chunk, account_id_map, balances, blacklist, windows, policy))
+    return verdicts
+
+def _verify_chunk(chunk, account_id_map, balances, blacklist, windows, policy):
+    """Verifies one chunk of a batch, sending only undecided transfers to Z3."""
+    sender = "USER_ACCOUNT"  # Hard-coded: all transfers must come from the authenticated user
+    verdicts = [None] * len(chunk)
+    rows, amounts, destination_ids = [], [], []
+
+    for i, tool_call in enumerate(chunk):
+        tool_name = tool_call.get('name')
+        if tool_name in READ_ONLY_TOOLS:
+            verdicts[i] = (True, f"Tool '{tool_name}' is approved as a safe read-only operation.")
+        elif tool_name != 'transfer_funds':
+            verdicts[i] = (False, f"Tool '{tool_name}' is not recognized or not permitted.")
+        else:
+            destination = tool_call['args'].get('destination')
+            # 1. Pre-check: Verify destination account exists (before attempting proof)
+            if destination not in account_id_map:
+                verdicts[i] = (False, f"Invalid Account: Destination '{destination}' does not exist. Available accounts: {', '.join(account_id_map)}.")
+            elif destination in blacklist:
+                verdicts[i] = (False, f"Blocked Account: Destination '{destination}' is on the security blacklist and cannot receive transfers.")
+            else:
+                rows.append(i)
+                amounts.append(tool_call['args'].get('amount'))
+                destination_ids.append(account_id_map[destination])
+
+    # 2. Symbolic Check: vectorized pre-screen, with Z3 for anything it cannot decide
+    sender_balance = balances.get(sender)
+    states = [None] * len(rows)
+    if policy.state_variables:
+        snapshots = [
+            {"sender_balance": sender_balance, **_window_fields(windows.get(chunk[i]['args']['destination']))} for i in rows
+        ]
+        states = [_policy_state(snapshot, policy.state_variables) for snapshot in snapshots]
+    statuses, violated = policy.prescreen(
+        amounts, destination_ids, [account_id_map[sender]] * len(rows),
+        {name: [state[name] for state in states] for name in policy.state_variables})
+    for row, (i, amount, status) in enumerate(zip(rows, amounts, statuses)):
+        destination = chunk[i]['args']['destination']
+        state = states[row]
+        if status == PRESCREEN_ACCEPT:
+            is_safe, reason = True, None
+        elif status == PRESCREEN_REJECT:
+            # The first violated rule in priority order is the one the unsat core names.
+            violated_rules = [policy.rule_ids[violated[row].argmax()]]
+            is_safe, reason = False, _violation_reason(violated_rules, amount, destination, sender, policy, state)
+        else:
+            is_safe, reason = _verify_against_policy(
+                amount, destination, sender, account_id_map[destination], account_id_map[sender], policy, state)
+        if not is_safe:
+            verdicts[i] = (False, reason)
+            continue
+
+        # 3. Heuristic Check for sufficient funds
+        if sender_balance is None or sender_balance < db.to_cents(amount):
+            verdicts[i] = (False, _insufficient_funds_reason(sender, sender_balance, amount))
+        else:
+            verdicts[i] = (True, "All transaction checks passed. Action is approved.")
+    return verdicts
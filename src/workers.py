@@ -0,0 +1,84 @@
+# workers.py
+"""
+Optional multiprocessing backend for guardian_check and batch verification.
+Each worker process imports z3, loads the rule program and compiles the policy once
+at start-up, then takes chunks of tool calls from the pool's task queue.
+Results come back in submission order.
+
+A worker's compiled policy and verdict cache are keyed on the account-set and blacklist
+versions stored in the database, so accounts added or removed by the parent (or any other
+process) are picked up on the worker's next check, not only when it is recycled.
+"""
+import multiprocessing
+from itertools import islice
+
+from config import VERIFIER_SETTINGS
+
+def _init_worker(database_file: str):
+    """Points the worker at the parent's database and pre-warms its compiled policy."""
+    import database as db
+    db.DATABASE_FILE = database_file
+
+    import verifier
+    with verifier._policy_pool.lease() as policy:
+        policy.admissible_intervals()
+
+def _guardian_check_chunk(tool_calls: list[dict]) -> list[tuple[bool, str]]:
+    import verifier
+    return [verifier.guardian_check(tool_call) for tool_call in tool_calls]
+
+def _verify_batch_chunk(tool_calls: list[dict]) -> list[tuple[bool, str]]:
+    import verifier
+    return verifier.verify_transactions_batch(tool_calls)
+
+class ProcessVerifier:
+    """
+    A pool of pre-warmed verification worker processes.
+    Worker count, chunk size and recycling after N chunks default to the
+    `process_*` keys of VERIFIER_SETTINGS.
+    """
+
+    def __init__(self, workers: int | None = None, chunk_size: int | None = None, max_tasks_per_child: int | None = None):
+        import database as db
+        self.workers = workers or VERIFIER_SETTINGS["process_workers"]
+        self.chunk_size = chunk_size or VERIFIER_SETTINGS["process_chunk_size"]
+        self.max_tasks_per_child = max_tasks_per_child or VERIFIER_SETTINGS["process_max_tasks_per_child"]
+        # Workers are spawned by default so that no Z3 context or database connection is inherited from the parent.
+        ctx = multiprocessing.get_context(VERIFIER_SETTINGS["process_start_method"])
+        self._pool = ctx.Pool(
+            processes=self.workers,
+            initializer=_init_worker,
+            initargs=(db.DATABASE_FILE,),
+            maxtasksperchild=self.max_tasks_per_child,
+        )
+
+    def guardian_check(self, tool_call: dict) -> tuple[bool, str]:
+        """Runs guardian_check for one tool call in a worker process."""
+        return self._pool.apply(_guardian_check_chunk, ([tool_call],))[0]
+
+    def guardian_check_many(self, tool_calls) -> list[tuple[bool, str]]:
+        """Runs guardian_check on every tool call, one call at a time inside the workers."""
+        return self._map(_guardian_check_chunk, tool_calls)
+
+    def verify_transactions_batch(self, tool_calls) -> list[tuple[bool, str]]:
+        """Splits a batch into chunks and runs verify_transactions_batch on them across the workers."""
+        return self._map(_verify_batch_chunk, tool_calls)
+
+    def _map(self, func, tool_calls) -> list[tuple[bool, str]]:
+        tool_calls = iter(tool_calls)
+        chunks = iter(lambda: list(islice(tool_calls, self.chunk_size)), [])
+        verdicts = []
+        for chunk_verdicts in self._pool.imap(func, chunks):
+            verdicts.extend(chunk_verdicts)
+        return verdicts
+
+    def close(self):
+        """Waits for outstanding work and shuts the workers down."""
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
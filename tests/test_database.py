@@ -0,0 +1,84 @@
+# tests/test_database.py
+"""
+Regression tests for opening and migrating the database concurrently.
+Run from the repository root with `python -m pytest tests`.
+"""
+import shutil
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+import database as db
+
+BASELINE_DATABASE = ROOT / "sentinel_verifier.db"
+THREADS = 8
+ROUNDS = 30  # The races are timing-dependent; each round opens a fresh copy.
+
+def _baseline_copy(tmp_path) -> tuple[str, dict[str, int]]:
+    """Copies the committed (schema v0, REAL dollars) database; returns its path and the expected balances in cents."""
+    tmp_path.mkdir(exist_ok=True)
+    path = str(tmp_path / "baseline.db")
+    shutil.copy(BASELINE_DATABASE, path)
+    raw = sqlite3.connect(path)
+    expected = {account: round(balance * 100) for account, balance in raw.execute("SELECT id, balance FROM accounts")}
+    raw.close()
+    return path, expected
+
+def _run_together(target, count: int = THREADS):
+    """Runs target(i) on `count` threads released at the same moment; re-raises the first error."""
+    barrier = threading.Barrier(count)
+    errors = []
+
+    def run(i):
+        barrier.wait()
+        try:
+            target(i)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+def _assert_migrated_once(path: str, expected: dict[str, int]):
+    raw = sqlite3.connect(path)
+    assert raw.execute("PRAGMA user_version").fetchone()[0] == db.SCHEMA_VERSION
+    assert dict(raw.execute("SELECT id, balance FROM accounts")) == expected
+    nums = [num for (num,) in raw.execute("SELECT account_num FROM accounts")]
+    assert sorted(nums) == list(range(len(expected)))
+    raw.close()
+
+def test_concurrent_first_open_through_the_pool_migrates_once(tmp_path, monkeypatch):
+    for round in range(ROUNDS):
+        path, expected = _baseline_copy(tmp_path / str(round))
+        monkeypatch.setattr(db, "DATABASE_FILE", path)
+        try:
+            _run_together(lambda i: db.get_account_balance("USER_ACCOUNT"))
+            assert {account["id"]: account["balance"] for account in db.get_all_accounts()} == expected
+        finally:
+            db.close_db_connection()
+        _assert_migrated_once(path, expected)
+
+def test_concurrent_migration_from_separate_connections_migrates_once(tmp_path):
+    # Separate connections stand in for separate processes, which share no in-process state.
+    for round in range(ROUNDS):
+        path, expected = _baseline_copy(tmp_path / str(round))
+
+        def open_and_migrate(i):
+            conn = sqlite3.connect(path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            try:
+                db.create_tables(conn)
+            finally:
+                conn.close()
+
+        _run_together(open_and_migrate)
+        _assert_migrated_once(path, expected)
@@ -0,0 +1,111 @@
+# tests/test_verifier.py
+"""
+Regression tests for the fast verification paths, which must agree with the Z3 proof.
+Run from the repository root with `python -m pytest tests`.
+"""
+import random
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+import database as db
+import fuzz
+import policy as policy_dsl
+import verifier
+
+DESTINATION, SENDER = 1, 0
+PRESCREEN_CASES = 2000
+SEED = 0
+
+# A policy over fractional money limits, whose boundaries binary floating point cannot hit exactly.
+FRACTIONAL_PARAMS = {"max_daily_total": 1000.66, "reserve": 20.05, "max_amount": 750.5}
+FRACTIONAL_RULES = [
+    {"id": "sender_authorized", "rule": {"eq": ["sender", {"account": "USER_ACCOUNT"}]}, "message": "Unauthorized sender."},
+    {"id": "positive", "rule": {"gt": ["amount", 0]}, "message": "Amounts must be positive."},
+    {"id": "max_amount", "rule": {"le": ["amount", {"param": "max_amount"}]}, "message": "Amount too large."},
+    {"id": "reserve", "rule": {"ge": [{"sub": ["balance", "amount"]}, {"param": "reserve"}]}, "message": "Reserve too low."},
+    {"id": "daily_total", "rule": {"le": [{"add": ["window_amount", "amount"]}, {"param": "max_daily_total"}]},
+     "message": "Daily total exceeded."},
+]
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Runs the test against a copy of the committed database."""
+    path = str(tmp_path / "verifier.db")
+    shutil.copy(ROOT / "sentinel_verifier.db", path)
+    monkeypatch.setattr(db, "DATABASE_FILE", path)
+    yield
+    db.close_db_connection()
+
+def _use_policy(monkeypatch, params: dict, rules: list[dict]):
+    monkeypatch.setattr(verifier, "SECURITY_RULES", {**verifier.SECURITY_RULES, **params})
+    monkeypatch.setattr(verifier, "POLICY_RULES", rules)
+    monkeypatch.setattr(verifier, "POLICY_SOURCE_HASH", None)
+
+def _compile(params: dict, rules: list[dict]) -> verifier.CompiledPolicy:
+    return verifier.CompiledPolicy(policy_dsl.load_program(params, rules), {})
+
+def _verdicts(policy: verifier.CompiledPolicy, amount: int, state: dict) -> dict:
+    """Returns the verdict of every path for one transfer: Z3, decide(), the pre-screen and the scalar rules."""
+    statuses, violated = policy.prescreen([amount], [DESTINATION], [SENDER], {name: [value] for name, value in state.items()})
+    scalar = all(holds(amount, DESTINATION, SENDER, state) for _, holds in policy.program.scalar_rules(policy.account_ids))
+    return {
+        "check": policy.check(amount, DESTINATION, SENDER, state)[0],
+        "decide": policy.decide(amount, DESTINATION, SENDER, state)[0],
+        "prescreen": {verifier.PRESCREEN_ACCEPT: True, verifier.PRESCREEN_REJECT: False}.get(statuses[0]),
+        "scalar": scalar,
+    }
+
+@pytest.mark.parametrize("load", [
+    verifier._current_program,
+    lambda: policy_dsl.load_program(FRACTIONAL_PARAMS, FRACTIONAL_RULES),
+], ids=["configured", "fractional"])
+def test_prescreen_agrees_with_z3(load):
+    program = load()
+    policy = verifier.CompiledPolicy(program, fuzz.FUZZ_ID_MAP)
+    rows = fuzz.generate_cases(program, PRESCREEN_CASES, random.Random(SEED))
+    amounts, destinations, senders, states = (list(column) for column in zip(*rows))
+    columns = {name: [state[name] for state in states] for name in policy.state_variables}
+
+    statuses, violated = policy.prescreen(amounts, destinations, senders, columns)
+    for row, status in enumerate(statuses):
+        if status == verifier.PRESCREEN_UNDECIDED:
+            continue
+        is_safe, core_rules = policy.check(*rows[row])
+        prescreen_rules = [rule_id for rule_id, hit in zip(policy.rule_ids, violated[row]) if hit]
+        assert is_safe == (status == verifier.PRESCREEN_ACCEPT), f"pre-screen verdict disagrees with Z3 for {rows[row]}"
+        assert core_rules == prescreen_rules[:1], f"unsat core {core_rules} != first pre-screen violation for {rows[row]}"
+    assert (statuses != verifier.PRESCREEN_UNDECIDED).sum() > PRESCREEN_CASES // 2
+
+def test_fractional_money_state_is_compared_exactly():
+    # 500.66 + 500 == 1000.66 exactly, but not in binary floating point.
+    policy = _compile(
+        {"max_daily_total": 1000.66},
+        [{"id": "daily_total", "rule": {"le": [{"add": ["window_amount", "amount"]}, {"param": "max_daily_total"}]},
+          "message": "Daily total exceeded."}])
+    state = verifier._policy_state({"window_amount": 50066}, policy.state_variables)
+    assert _verdicts(policy, 500, state) == {"check": True, "decide": True, "prescreen": True, "scalar": True}
+    assert _verdicts(policy, 501, state) == {"check": False, "decide": False, "prescreen": False, "scalar": False}
+
+def test_prescreen_leaves_inexact_state_to_z3():
+    policy = _compile({}, [{"id": "funded", "rule": {"le": ["amount", "balance"]}, "message": "Insufficient funds."}])
+    statuses, _ = policy.prescreen([1, 1], [DESTINATION] * 2, [SENDER] * 2, {"balance": [1 / 3, None]})
+    assert list(statuses) == [verifier.PRESCREEN_UNDECIDED] * 2
+
+def test_max_permissible_amount_respects_a_minimum_amount(database, monkeypatch):
+    _use_policy(monkeypatch, {"min_amount": 50}, [
+        {"id": "sender_authorized", "rule": {"eq": ["sender", {"account": "USER_ACCOUNT"}]}, "message": "Unauthorized sender."},
+        {"id": "minimum", "rule": {"ge": ["amount", {"param": "min_amount"}]}, "message": "Transfers must be at least {min_amount}."},
+    ])
+    db.update_account_balance("USER_ACCOUNT", 30 * db.CENTS_PER_DOLLAR)
+    assert verifier.max_permissible_amount("Account_A") == (0, "Transfers must be at least 50.")
+
+    db.update_account_balance("USER_ACCOUNT", 80 * db.CENTS_PER_DOLLAR + 99)
+    amount, reason = verifier.max_permissible_amount("Account_A")
+    assert (amount, reason) == (80, "Limited by the balance of USER_ACCOUNT: $80.99.")
+    assert verifier.guardian_check({"name": "transfer_funds", "args": {"amount": amount, "destination": "Account_A"}})[0]